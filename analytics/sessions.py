@@ -0,0 +1,139 @@
+from datetime import datetime
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import archive
+from database.models import StudySession, Subscriptions
+
+# Study sessions as NumPy columns. Times are the stored epoch seconds, which
+# count wall-clock time as if it were UTC, so days and hours come straight
+# out of integer division.
+
+COLUMNS = ["id", "course_id", "start", "end", "duration"]
+DAY = 86400
+
+
+class StudyColumns:
+
+    def __init__(self, id, course_id, start, end, duration):
+        self.id = id
+        self.course_id = course_id
+        self.start = start
+        self.end = end
+        self.duration = duration
+
+    def __len__(self):
+        return len(self.id)
+
+
+def selectColumns(user_id: int = None, course_id: int = None,
+                    since: datetime = None, until: datetime = None,
+                    tables: list = None):
+    source = archive.unionSessions(tables or [StudySession.__table__])
+    statement = select(
+            source.c.id,
+            Subscriptions.course_id,
+            source.c.start_epoch,
+            source.c.end_epoch,
+            source.c.duration_seconds).\
+        join(Subscriptions, source.c.subscription_id==Subscriptions.id).\
+        where(source.c.duration_seconds.isnot(None))
+    if user_id is not None:
+        statement = statement.where(Subscriptions.user_id==user_id)
+    if course_id is not None:
+        statement = statement.where(Subscriptions.course_id==course_id)
+    if since:
+        statement = statement.where(source.c.start_session >= since)
+    if until:
+        statement = statement.where(source.c.start_session < until)
+    # no ORDER BY: every analysis below is independent of row order
+    return statement
+
+
+def loadColumns(db: Session, user_id: int = None, course_id: int = None,
+                since: datetime = None, until: datetime = None,
+                batchSize: int = 10000):
+    """Load study sessions into int64 arrays without building row objects.
+
+    Batches are fetched from the DBAPI cursor itself, skipping SQLAlchemy's
+    row processing that integer columns do not need, and each one is
+    flattened into an array, so memory stays close to the size of the
+    arrays themselves.
+    """
+    result = db.connection().execute(
+        selectColumns(user_id, course_id, since, until,
+                        archive.sessionTables(db, since, until)))
+    chunks = []
+    try:
+        while True:
+            rows = result.cursor.fetchmany(batchSize)
+            if not rows:
+                break
+            chunk = np.fromiter(chain.from_iterable(rows), dtype=np.int64,
+                                count=len(rows) * len(COLUMNS))
+            chunks.append(chunk.reshape(-1, len(COLUMNS)))
+    finally:
+        result.close()
+    table = np.concatenate(chunks) if chunks else \
+        np.empty((0, len(COLUMNS)), dtype=np.int64)
+    return StudyColumns(*(table[:, i].copy() for i in range(len(COLUMNS))))
+
+
+def totals(keys, values):
+    """Return the distinct keys with the sum and count of their values."""
+    unique, index = np.unique(keys, return_inverse=True)
+    return (unique, np.bincount(index, weights=values).astype(np.int64),
+            np.bincount(index))
+
+
+def percentiles(values, q=(50, 90, 99)):
+    if len(values) == 0:
+        return np.zeros(len(q))
+    return np.percentile(values, q)
+
+
+def dailyTotals(start, duration):
+    """Return the first day number and the seconds studied on every day
+    from it to the last day with a session, zeros included."""
+    if len(start) == 0:
+        return 0, np.zeros(0, dtype=np.int64)
+    days = start // DAY
+    first = days.min()
+    return first, np.bincount(days - first, weights=duration).astype(np.int64)
+
+
+def rolling(values, window: int):
+    """Mean of every ``window`` consecutive values."""
+    if len(values) < window:
+        return np.zeros(0)
+    sums = np.cumsum(np.concatenate(([0], values)), dtype=np.float64)
+    return (sums[window:] - sums[:-window]) / window
+
+
+def streaks(start, today: int = None):
+    """Return the longest and the current run of consecutive study days.
+
+    ``today`` is a day number; the current streak is the run ending today
+    or yesterday, zero otherwise.
+    """
+    days = np.unique(start // DAY)
+    if len(days) == 0:
+        return 0, 0
+    breaks = np.flatnonzero(np.diff(days) != 1)
+    edges = np.concatenate(([0], breaks + 1, [len(days)]))
+    lengths = np.diff(edges)
+    current = 0
+    if today is None or days[-1] >= today - 1:
+        current = int(lengths[-1])
+    return int(lengths.max()), current
+
+
+def heatmap(start, duration):
+    """Seconds studied per weekday (rows, from Sunday) and hour (columns)."""
+    weekday = (start // DAY + 4) % 7
+    hour = start % DAY // 3600
+    return np.bincount(weekday * 24 + hour, weights=duration,
+                        minlength=7 * 24).astype(np.int64).reshape(7, 24)
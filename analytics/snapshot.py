@@ -0,0 +1,151 @@
+import json
+import os
+from datetime import datetime
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from database import archive
+from database.models import Subscriptions, toEpoch
+from analytics.sessions import StudyColumns
+
+# A copy of studysession, archives included, as one flat int64 file per
+# column, opened with np.memmap so reads go straight to the page cache.
+# meta.json records how many rows the files hold, the last id copied and
+# the sum of every column: a refresh appends the rows after that id, which
+# AUTOINCREMENT never hands out again, and starts over when the rows at or
+# below it no longer add up to the same count and sums, as after deletes or
+# most edits. An edit that leaves every sum unchanged needs a rebuild.
+
+SNAPSHOT_DIR = os.environ.get("STUDY_SNAPSHOT_DIR", "snapshot")
+COLUMNS = ["id", "subscription_id", "start_epoch", "end_epoch",
+            "duration_seconds"]
+META_FILE = "meta.json"
+
+
+def snapshotted(source):
+    return (source.c.subscription_id.isnot(None),
+            source.c.duration_seconds.isnot(None))
+
+
+def columnPath(path: str, name: str):
+    return os.path.join(path, f"{name}.i64")
+
+
+def readMeta(path: str = SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(path, META_FILE)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"rows": 0, "last_id": 0, "sums": [0] * len(COLUMNS)}
+
+
+def writeMeta(path: str, meta: dict):
+    metaPath = os.path.join(path, META_FILE)
+    with open(metaPath + ".tmp", "w") as file:
+        json.dump(meta, file)
+    os.replace(metaPath + ".tmp", metaPath)
+
+
+def truncate(path: str, rows: int):
+    # drops anything written after the last completed refresh
+    for name in COLUMNS:
+        with open(columnPath(path, name), "ab") as file:
+            file.truncate(rows * 8)
+
+
+def refresh(db: Session, path: str = SNAPSHOT_DIR, rebuild: bool = False,
+            batchSize: int = 65536):
+    """Bring the snapshot up to date, returning (appended, rows, rebuilt)."""
+    os.makedirs(path, exist_ok=True)
+    meta = readMeta(path)
+    source = archive.unionSessions(archive.sessionTables(db))
+    if not rebuild and meta["rows"]:
+        copied = db.execute(select(func.count(source.c.id),
+                                    *(func.coalesce(func.sum(source.c[name]), 0)
+                                        for name in COLUMNS)).where(
+            source.c.id <= meta["last_id"], *snapshotted(source))).one()
+        rebuild = list(copied) != [meta["rows"], *meta.get("sums", [])]
+    if rebuild:
+        meta = {"rows": 0, "last_id": 0, "sums": [0] * len(COLUMNS)}
+    truncate(path, meta["rows"])
+
+    result = db.connection().execute(
+        select(*(source.c[name] for name in COLUMNS)).
+            where(source.c.id > meta["last_id"], *snapshotted(source)).
+            order_by(source.c.id))
+    files = {name: open(columnPath(path, name), "ab") for name in COLUMNS}
+    appended = 0
+    try:
+        while True:
+            rows = result.cursor.fetchmany(batchSize)
+            if not rows:
+                break
+            table = np.fromiter(chain.from_iterable(rows), dtype=np.int64,
+                                count=len(rows) * len(COLUMNS)).\
+                reshape(-1, len(COLUMNS))
+            for i, name in enumerate(COLUMNS):
+                files[name].write(table[:, i].tobytes())
+                meta["sums"][i] += int(table[:, i].sum())
+            appended += len(rows)
+            meta["last_id"] = int(table[-1, 0])
+    finally:
+        result.close()
+        for file in files.values():
+            file.close()
+    meta["rows"] += appended
+    meta["refreshed_on"] = datetime.now().isoformat(timespec="seconds")
+    writeMeta(path, meta)
+    return appended, meta["rows"], rebuild
+
+
+def openSnapshot(path: str = SNAPSHOT_DIR):
+    """Map every column read-only; nothing is read until it is used."""
+    rows = readMeta(path)["rows"]
+    if rows == 0:
+        return {name: np.zeros(0, dtype=np.int64) for name in COLUMNS}
+    return {name: np.memmap(columnPath(path, name), dtype=np.int64,
+                            mode="r", shape=(rows,))
+            for name in COLUMNS}
+
+
+def loadColumns(db: Session, user_id: int = None, course_id: int = None,
+                since: datetime = None, until: datetime = None,
+                path: str = SNAPSHOT_DIR):
+    """Same as analytics.sessions.loadColumns, read from the snapshot."""
+    columns = openSnapshot(path)
+    subscriptions = db.execute(select(Subscriptions.id, Subscriptions.user_id,
+                                        Subscriptions.course_id)).all()
+    size = max([row.id for row in subscriptions] + [0]) + 1
+    userOf = np.full(size, -1, dtype=np.int64)
+    courseOf = np.full(size, -1, dtype=np.int64)
+    for row in subscriptions:
+        userOf[row.id] = row.user_id if row.user_id is not None else -1
+        courseOf[row.id] = row.course_id if row.course_id is not None else -1
+
+    subscriptionID = columns["subscription_id"]
+    # subscriptions deleted after the snapshot was taken are left out
+    known = subscriptionID < size
+    if not known.all():
+        subscriptionID = np.where(known, subscriptionID, 0)
+    mask = known & (courseOf[subscriptionID] >= 0)
+    if user_id is not None:
+        mask &= userOf[subscriptionID] == user_id
+    if course_id is not None:
+        mask &= courseOf[subscriptionID] == course_id
+    if since:
+        mask &= columns["start_epoch"] >= toEpoch(since)
+    if until:
+        mask &= columns["start_epoch"] < toEpoch(until)
+
+    if mask.all():
+        # no filter to apply: hand out the mapped columns themselves
+        return StudyColumns(columns["id"], courseOf[subscriptionID],
+                            columns["start_epoch"], columns["end_epoch"],
+                            columns["duration_seconds"])
+    return StudyColumns(columns["id"][mask], courseOf[subscriptionID[mask]],
+                        columns["start_epoch"][mask],
+                        columns["end_epoch"][mask],
+                        columns["duration_seconds"][mask])
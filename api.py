@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.aiocrud import AsyncCrudCourse, AsyncCrudStudy
+from database.aiocrud import AsyncCrudSubscription, AsyncCrudUser
+from database.aiodb import asyncEngine
+from database.cache import lookupCache
+from database.handler import AsyncDbHandler
+from schema import schema
+
+app = FastAPI(title="study")
+
+MAX_PAGE = 1000
+
+
+class ChangeWatcher:
+    """Tell whether the database changed since the last report.
+
+    PRAGMA data_version on a dedicated connection changes whenever any other
+    connection, in this process or another, commits to the database file.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def version(self) -> int:
+        with self.lock:
+            return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+watcher = ChangeWatcher(make_url(str(asyncEngine.url)).database)
+reports = {}
+
+
+async def getDb():
+    async with AsyncDbHandler() as db:
+        yield db
+
+
+async def readUserId(db: AsyncSession, email: str):
+    userID = await AsyncCrudUser().readUserIdByName(db, email)
+    if userID is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return userID
+
+
+@app.on_event("startup")
+async def warmLookupCache():
+    async with AsyncDbHandler() as db:
+        await db.run_sync(lookupCache.warm)
+
+
+@app.on_event("shutdown")
+async def closeConnections():
+    # pooled aiosqlite connections each hold a thread that would otherwise
+    # keep the process alive
+    await asyncEngine.dispose()
+    watcher.close()
+
+
+@app.get("/users/{email}/subscriptions",
+            response_model=List[schema.Subscription])
+async def readSubscriptions(email: str, db: AsyncSession = Depends(getDb)):
+    userID = await readUserId(db, email)
+    return await AsyncCrudSubscription().readSubscriptions(db, userID)
+
+
+@app.get("/users/{email}/sessions", response_model=List[schema.StudySession])
+async def readStudySessions(email: str, course: str, response: Response,
+                            limit: int = Query(100, ge=1, le=MAX_PAGE),
+                            since: Optional[datetime] = None,
+                            until: Optional[datetime] = None,
+                            cursor: Optional[str] = None,
+                            db: AsyncSession = Depends(getDb)):
+    userID = await readUserId(db, email)
+    courseID = await AsyncCrudCourse().readCourseIdByName(db, course)
+    if courseID is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    dbSubscription = await AsyncCrudSubscription().\
+        readSubscriptionByUserAndCourse(db, userID, courseID)
+    if not dbSubscription:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    after = None
+    if cursor:
+        try:
+            startSession, id = cursor.rsplit(",", 1)
+            after = datetime.fromisoformat(startSession), int(id)
+        except ValueError:
+            raise HTTPException(status_code=422,
+                                detail="cursor must be START_SESSION,ID")
+    dbStudySessions = await AsyncCrudStudy().readStudySessionsPage(db,
+                        [dbSubscription.id], limit + 1, since, until, after)
+    if len(dbStudySessions) > limit:
+        dbStudySessions = dbStudySessions[:limit]
+        last = dbStudySessions[-1]
+        response.headers["X-Next-Cursor"] = \
+            f"{last.start_session.isoformat()},{last.id}"
+    return dbStudySessions
+
+
+@app.post("/users/{email}/sessions", status_code=201)
+async def createStudySession(email: str, payload: schema.NewStudySession,
+                                db: AsyncSession = Depends(getDb)):
+    userID = await readUserId(db, email)
+    courseID = await AsyncCrudCourse().readCourseIdByName(db, payload.course)
+    if courseID is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    dbSubscription = await AsyncCrudSubscription().\
+        readSubscriptionByUserAndCourse(db, userID, courseID)
+    if not dbSubscription:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    await AsyncCrudStudy().createStudySession(db, schema.BaseStudySession(
+        subscription_id = dbSubscription.id,
+        start_session = payload.start_session,
+        end_session = payload.end_session
+    ))
+    return {"detail": "Study session saved"}
+
+
+@app.get("/users/{email}/report", response_model=List[schema.ReportRow])
+async def readReport(email: str, request: Request, response: Response,
+                        db: AsyncSession = Depends(getDb)):
+    etag = f'"{email.upper()}-{watcher.version()}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    cached = reports.get(email.upper())
+    if cached and cached[0] == etag:
+        report = cached[1]
+    else:
+        userID = await readUserId(db, email)
+        report = [schema.ReportRow.from_orm(row)
+                    for row in await AsyncCrudStudy().readReport(db, userID)]
+        reports[email.upper()] = (etag, report)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return report
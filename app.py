@@ -1,66 +1,104 @@
 import click
-import pandas as pd
-from tabulate import tabulate
+import shlex
+import sys
+import time
 from datetime import datetime, date, timedelta
+from itertools import chain
+from pydantic import ValidationError
 
 from database.crud import CrudCategory, CrudCourse, CrudSession, CrudUser
-from database.crud import CrudStudy, CrudSubscription
+from database.crud import CrudStudy, CrudSubscription, REPORT_BUCKETS
+from database.db import engine
 from database.handler import DbHandler
+from database.models import toEpoch
+from profiling import profiler
+from render.table import renderTable
 from schema import schema
+from transfer import exporter, importer
 
 
-@click.group()
-def main():
-    pass
+class UnitOfWork(click.Group):
+    # Every command runs in one database session and one transaction, shared
+    # through ctx.obj. ctx.exit() ends a command successfully and commits;
+    # any other exception, including ctx.abort(), rolls back.
 
+    def invoke(self, ctx):
+        with DbHandler(commitOn=(click.exceptions.Exit,)) as db:
+            ctx.obj = db
+            return super().invoke(ctx)
 
-def checkUser():
+
+@click.group(cls=UnitOfWork)
+@click.option("--profile", is_flag=True,
+                help="Print SQL and per-phase timings to stderr.")
+@click.option("--profile-file", "profileFile",
+                type=click.Path(dir_okay=False, writable=True),
+                help="Also dump cProfile stats to this file.")
+@click.pass_context
+def main(ctx, profile, profileFile):
+    if profile or profileFile:
+        profiler.start(engine, profileFile)
+        ctx.call_on_close(reportProfile)
+
+
+def reportProfile():
+    for line in profiler.stop().report():
+        click.echo(line, err=True)
+
+
+# Inside `shell` the logged user is looked up once and reused by every
+# command until --login or --logoff changes it.
+shellState = {"active": False, "userID": None}
+
+
+def checkUser(db):
+    if shellState["userID"] is not None:
+        return shellState["userID"]
     crud = CrudSession()
-    with DbHandler() as db:
-        session = crud.readActiveSession(db)
-        if not session:
-            click.secho("No user logged, please log in", fg="red")
-            exit()
-        userID = session.user_id
-    return userID   
-    
+    session = crud.readActiveSession(db)
+    if not session:
+        click.secho("No user logged, please log in", fg="red")
+        sys.exit()
+    if shellState["active"]:
+        shellState["userID"] = session.user_id
+    return session.user_id
+
 
 def deleteStudySession(ctx, param, value):
     if not value or ctx.resilient_parsing:
         return
-    
-    userID = checkUser()
+
+    db = ctx.obj
+    userID = checkUser(db)
+    studySessionID = click.prompt("Study session id", type=int)
     crud = CrudStudy()
-    with DbHandler() as db:        
-        dbStudySession = crud.readStudySessionById(db, userID)
-        if not dbStudySession:
-            click.secho("Study session not found", fg="red")
-            ctx.abort()
-        crud.deleteStudySession(db, dbStudySession)
-        click.secho("Study session delete", fg="green")
+    dbStudySession = crud.readStudySessionById(db, studySessionID)
+    if not dbStudySession or dbStudySession.subscription.user_id != userID:
+        click.secho("Study session not found", fg="red")
+        ctx.abort()
+    crud.deleteStudySession(db, dbStudySession)
+    click.secho("Study session delete", fg="green")
     ctx.exit()
 
 
 def createStudySession(ctx, param, value):
     if not value or ctx.resilient_parsing:
         return
-    
-    userID = checkUser()
+
+    db = ctx.obj
+    userID = checkUser(db)
     course = click.prompt("Course", type=str)
     crud = CrudCourse()
-    with DbHandler() as db:
-        dbCourse = crud.readCourseByName(db, course)
-        if not dbCourse:    
-            click.secho("Course not found", fg="red")
-            ctx.abort()
-        courseID = dbCourse.id 
+    courseID = crud.readCourseIdByName(db, course)
+    if not courseID:
+        click.secho("Course not found", fg="red")
+        ctx.abort()
     crud = CrudSubscription()
-    with DbHandler() as db:        
-        dbSubscription = crud.readSubscriptionByUserAndCourse(db, userID, courseID)
-        if not dbSubscription:
-            click.secho("Subscription not found", fg="red")
-            ctx.abort()
-        subscriptionID = dbSubscription.id
+    dbSubscription = crud.readSubscriptionByUserAndCourse(db, userID, courseID)
+    if not dbSubscription:
+        click.secho("Subscription not found", fg="red")
+        ctx.abort()
+    subscriptionID = dbSubscription.id
     startSession = datetime.now()
     click.secho(f"{startSession.strftime('%d-%m-%y %H:%M:%S')}: ",
                 fg="blue", nl=None)
@@ -77,134 +115,493 @@ def createStudySession(ctx, param, value):
         end_session = endSession
      )
     crud = CrudStudy()
-    with DbHandler() as db:
-        crud.createStudySession(db, payload)
+    crud.createStudySession(db, payload)
     click.secho("Study session saved", fg="green")
     ctx.exit()
 
 
+DATETIME_FORMAT = "%d-%m-%y %H:%M:%S"
+DATE_FORMATS = ["%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"]
+
+
+def echoTable(headers, rows, **kwargs):
+    with profiler.phase("render"):
+        for line in renderTable(headers, rows, **kwargs):
+            click.echo(line)
+
+
+WEEKDAYS = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday",
+            "Saturday"]
+
+
+def formatBucket(by, bucket):
+    if by == "weekday":
+        return WEEKDAYS[int(bucket)]
+    if by == "hour":
+        return f"{bucket}:00"
+    return bucket
+
+
+def formatSeconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
 def readReport(ctx, param, value):
     if not value or ctx.resilient_parsing:
         return
 
-    userID = checkUser()
-    crud = CrudSubscription()
-    with DbHandler() as db: 
-        dbSubscriptions = crud.readSubscriptionByUser(db, userID)
-        if not dbSubscriptions:
-            click.secho("Subscriptions not found", fg="red")
-            click.echo("Abort!")
-            exit()
-        subscriptionIDs = []
-        for subscription in dbSubscriptions:
-            subscriptionIDs.append(subscription.id)
+    # --by, --stats, --snapshot, --dir, --since and --until are eager, so
+    # they are parsed by now
+    by = ctx.params.get("by")
+    if by and ctx.params.get("stats"):
+        raise click.UsageError("--by cannot be used with --stats")
+    if ctx.params.get("snapshotDir") and not ctx.params.get("snapshot"):
+        raise click.UsageError("--dir can only be used with --snapshot")
+    db = ctx.obj
+    userID = checkUser(db)
+    if ctx.params.get("stats"):
+        reportStats(ctx, db, userID)
     crud = CrudStudy()
-    with DbHandler() as db:
-        dbStudySessions = crud.readStudySessions(db, subscriptionIDs)
-        listStudySessions = []
-        for studySession in dbStudySessions:
-            listStudySessions.append(
-                            schema.StudySession.from_orm(studySession).dict())
-            
-    if len(listStudySessions) == 0:
+    with profiler.phase("fetch"):
+        dbReport = crud.readReport(db, userID, by, ctx.params.get("since"),
+                                    ctx.params.get("until"))
+
+    if len(dbReport) == 0:
         click.secho("Study sessions not found", fg="red")
-        exit()
-
-    df = pd.json_normalize(listStudySessions)
-    df.rename(columns={"subscription.course.name": "course"}, inplace=True)
-    df.course = df.course.apply(lambda x: x.title())
-    df = df.reindex(columns=["course", "time_session"])
-    df = df.groupby(["course"], as_index=False).sum()#.astype(str)
-    df.time_session = df.time_session.apply(
-        lambda x: datetime.utcfromtimestamp(
-            x.total_seconds()).strftime("%H:%M:%S")
-    )
-    df.rename(str.title, axis="columns", inplace=True) 
-    click.echo(tabulate(df, headers="keys", showindex=False
-                        ,tablefmt="simple"))
+        sys.exit()
+
+    headers = ["Course", "Time_Session", "Sessions"]
+    aligns = ["left", "left", "right"]
+    with profiler.phase("frame"):
+        report = [(row.course.title(), formatSeconds(row.total_seconds),
+                    row.session_count) for row in dbReport]
+        if by:
+            headers.insert(0, by.title())
+            aligns.insert(0, "left")
+            report = [(formatBucket(by, row.bucket),) + line
+                        for row, line in zip(dbReport, report)]
+    echoTable(headers, report, aligns=aligns)
     ctx.exit()
 
 
+def reportStats(ctx, db, userID):
+    try:
+        from analytics import sessions as analytics
+        from analytics import snapshot
+    except ImportError:
+        click.secho("Study statistics require numpy", fg="red")
+        sys.exit()
+
+    options = {"since": ctx.params.get("since"),
+                "until": ctx.params.get("until")}
+    loader = analytics.loadColumns
+    if ctx.params.get("snapshot"):
+        loader = snapshot.loadColumns
+        options["path"] = ctx.params.get("snapshotDir") or \
+            snapshot.SNAPSHOT_DIR
+    with profiler.phase("fetch"):
+        columns = loader(db, userID, **options)
+        courses = {row.id: row.name for row in CrudCourse().readCourseRows(db)}
+    if len(columns) == 0:
+        click.secho("Study sessions not found", fg="red")
+        sys.exit()
+
+    with profiler.phase("frame"):
+        report = []
+        for courseID, seconds, count in zip(*analytics.totals(
+                columns.course_id, columns.duration)):
+            median, p90 = analytics.percentiles(
+                columns.duration[columns.course_id == courseID], (50, 90))
+            report.append((courses[courseID].title(), formatSeconds(seconds),
+                            count, formatSeconds(median), formatSeconds(p90)))
+        report.sort()
+        today = toEpoch(datetime.now()) // analytics.DAY
+        longest, current = analytics.streaks(columns.start, today)
+        first, daily = analytics.dailyTotals(columns.start, columns.duration)
+        week = analytics.rolling(daily, 7)
+    echoTable(["Course", "Time_Session", "Sessions", "Median", "P90"], report,
+                aligns=["left", "left", "right", "left", "left"])
+    click.echo()
+    click.secho("Study days: ", fg="blue", nl=None)
+    click.echo(f"{int((daily > 0).sum())} of {len(daily)}, "
+                f"longest streak {longest}, current streak {current}")
+    if len(week):
+        click.secho("7 day average: ", fg="blue", nl=None)
+        click.echo(f"last {formatSeconds(week[-1])}, "
+                    f"best {formatSeconds(week.max())} a day")
+    ctx.exit()
+
+
+def rebuildRollup(ctx, param, value):
+    if not value or ctx.resilient_parsing:
+        return
+
+    db = ctx.obj
+    crud = CrudStudy()
+    crud.rebuildDailyRollup(db)
+    click.secho("Daily rollup rebuilt", fg="green")
+    ctx.exit()
+
+
+def parseCursor(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        startSession, id = value.rsplit(",", 1)
+        return datetime.fromisoformat(startSession), int(id)
+    except ValueError:
+        raise click.BadParameter("expected START_SESSION,ID")
+
+
+def formatCursor(row):
+    return f"{row.start_session.isoformat()},{row.id}"
+
+
 @main.command()
-@click.option("--report", is_flag=True, callback=readReport, 
+@click.option("--report", is_flag=True, callback=readReport,
                 expose_value=False)
-@click.option("--new", is_flag=True, callback=createStudySession, 
+@click.option("--new", is_flag=True, callback=createStudySession,
                 expose_value=False)
-@click.option("--delete", is_flag=True, callback=deleteStudySession, 
+@click.option("--delete", is_flag=True, callback=deleteStudySession,
                 expose_value=False)
-def study():
-    userID = checkUser()
+@click.option("--rebuild", is_flag=True, callback=rebuildRollup,
+                expose_value=False,
+                help="Recompute the daily study time rollup from scratch.")
+@click.option("--limit", type=click.IntRange(min=1),
+                help="Number of sessions per page.")
+@click.option("--since", type=click.DateTime(DATE_FORMATS), is_eager=True,
+                help="Only sessions started on or after this time.")
+@click.option("--until", type=click.DateTime(DATE_FORMATS), is_eager=True,
+                help="Only sessions started before this time.")
+@click.option("--by", type=click.Choice(list(REPORT_BUCKETS)), is_eager=True,
+                help="Break the --report down by period.")
+@click.option("--stats", is_flag=True, is_eager=True,
+                help="Show duration percentiles, streaks and rolling "
+                    "averages with --report.")
+@click.option("--snapshot", is_flag=True, is_eager=True,
+                help="Compute --stats from the snapshot taken by the "
+                    "snapshot command instead of the database.")
+@click.option("--dir", "snapshotDir", default=None, is_eager=True,
+                help="Snapshot directory for --snapshot, as given to the "
+                    "snapshot command; STUDY_SNAPSHOT_DIR or ./snapshot by "
+                    "default.")
+@click.option("--cursor", callback=parseCursor,
+                help="Resume after the cursor printed by the previous page.")
+@click.pass_obj
+def study(db, limit, since, until, by, stats, snapshot, snapshotDir, cursor):
+    if by or stats or snapshot or snapshotDir:
+        raise click.UsageError("--by, --stats, --snapshot and --dir can only "
+                                "be used with --report")
+    userID = checkUser(db)
     course = click.prompt("Course", type=str)
     crud = CrudCourse()
-    with DbHandler() as db:
-        dbCourse = crud.readCourseByName(db, course)
-        if not dbCourse:    
-            click.secho("Course not found", fg="red")
-            click.echo("Abort!")
-            exit()
-        courseID = dbCourse.id
+    courseID = crud.readCourseIdByName(db, course)
+    if not courseID:
+        click.secho("Course not found", fg="red")
+        click.echo("Abort!")
+        sys.exit()
     crud = CrudSubscription()
-    with DbHandler() as db: 
-        dbSubscription = crud.readSubscriptionByUserAndCourse(db, userID, courseID)
-        if not dbSubscription:
-            click.secho("Subscription not found", fg="red")
-            click.echo("Abort!")
-            exit()
-        subscriptionID = dbSubscription.id
+    dbSubscription = crud.readSubscriptionByUserAndCourse(db, userID, courseID)
+    if not dbSubscription:
+        click.secho("Subscription not found", fg="red")
+        click.echo("Abort!")
+        sys.exit()
+    subscriptionID = dbSubscription.id
+    user = dbSubscription.user.email.lower()
+    course = dbSubscription.course.name.title()
     crud = CrudStudy()
-    with DbHandler() as db:
-        dbStudySessions = crud.readStudySessions(db, [subscriptionID])
-        listStudySessions = []
-        for studySession in dbStudySessions:
-            listStudySessions.append(
-                            schema.StudySession.from_orm(studySession).dict())
-            
-    if len(listStudySessions) == 0:
+    nextCursor = None
+    if limit:
+        with profiler.phase("fetch"):
+            dbStudySessions = crud.readStudySessionRowsPage(db,
+                                [subscriptionID], limit + 1, since, until,
+                                cursor)
+        if len(dbStudySessions) > limit:
+            dbStudySessions = dbStudySessions[:limit]
+            nextCursor = formatCursor(dbStudySessions[-1])
+    else:
+        dbStudySessions = crud.iterStudySessionRows(db, [subscriptionID],
+                            since, until, cursor)
+    dbStudySessions = iter(profiler.timed("fetch", dbStudySessions))
+    firstStudySession = next(dbStudySessions, None)
+    if not firstStudySession:
         click.secho("Study sessions not found", fg="red")
-        exit()
-
-    df = pd.json_normalize(listStudySessions)
-    df.rename(columns={"subscription.course.name": "course", 
-        "subscription.user.email": "user"}, inplace=True)
-    df.course = df.course.apply(lambda x: x.title())
-    df.user = df.user.apply(lambda x: x.lower())
-    df.start_session = df.start_session.apply(
-        lambda x: x.strftime("%d-%m-%y %H:%M:%S")
-    )
-    df.end_session = df.end_session.apply(
-        lambda x: x.strftime("%d-%m-%y %H:%M:%S")
-    )
-    df.time_session = df.time_session.apply(
-        lambda x: datetime.utcfromtimestamp(
-            x.total_seconds()).strftime("%H:%M:%S")
-    )
-    df = df.reindex(columns=["id", "user", "course", "start_session",
-        "end_session", "time_session"])
-    df.rename(str.title, axis="columns", inplace=True)    
-    click.echo(tabulate(df, headers="keys", showindex=False
-                        ,tablefmt="simple"))
+        sys.exit()
+
+    def rows():
+        for row in chain([firstStudySession], dbStudySessions):
+            with profiler.phase("frame"):
+                line = (
+                    row.id,
+                    row.user.lower(),
+                    row.course.title(),
+                    row.start_session.strftime(DATETIME_FORMAT),
+                    row.end_session.strftime(DATETIME_FORMAT),
+                    formatSeconds(
+                        (row.end_session - row.start_session).total_seconds()),
+                )
+            yield line
+
+    echoTable(["Id", "User", "Course", "Start_Session", "End_Session",
+                "Time_Session"], rows(),
+                widths=[8, len(user), len(course), 17, 17, 8],
+                aligns=["right"] + ["left"] * 5)
+    if nextCursor:
+        click.secho("Next page: ", fg="blue", nl=None)
+        click.echo(f"--cursor {nextCursor}")
+
+
+@main.command(name="import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fileFormat", type=click.Choice(importer.FORMATS),
+                help="Input format, detected from the file extension by default.")
+@click.option("--batch-size", "batchSize", default=5000, show_default=True,
+                type=click.IntRange(min=1))
+@click.pass_obj
+def importStudySessions(db, path, fileFormat, batchSize):
+    userID = checkUser(db)
+    fileFormat = fileFormat or importer.detectFormat(path)
+    if not fileFormat:
+        click.secho("Unknown file format, use --format", fg="red")
+        sys.exit()
+
+    crud = CrudSubscription()
+    subscriptionIDs = {}
+    for dbSubscription in crud.readSubscriptionByUser(db, userID,
+                                                        strategy="joined"):
+        subscriptionIDs.setdefault(dbSubscription.course.name,
+                                    dbSubscription.id)
+
+    # any bad row raises ClickException, which rolls the whole import back
+    def payloads():
+        rows = importer.readRows(path, fileFormat)
+        try:
+            for line, row in enumerate(rows, start=1):
+                course = str(row.get("course", "")).upper()
+                if course not in subscriptionIDs:
+                    raise click.ClickException(f"row {line}: not subscribed "
+                                                f"to course {course.title()!r}")
+                missing = [field for field in ("start_session", "end_session")
+                            if not row.get(field)]
+                if missing:
+                    raise click.ClickException(
+                        f"row {line}: missing {' and '.join(missing)}")
+                try:
+                    payload = schema.BaseStudySession(
+                        subscription_id = subscriptionIDs[course],
+                        start_session = row["start_session"],
+                        end_session = row["end_session"]
+                    )
+                except ValidationError as error:
+                    raise click.ClickException(f"row {line}: {error}")
+                payload.start_session = importer.localTime(payload.start_session)
+                payload.end_session = importer.localTime(payload.end_session)
+                yield payload
+        except ValueError as error:
+            # malformed lines, reported by the reader with their number
+            raise click.ClickException(str(error))
+
+    crud = CrudStudy()
+    start = time.perf_counter()
+    count = crud.bulkCreate(db, payloads(), batchSize)
+    db.commit()
+    elapsed = time.perf_counter() - start
+    click.secho(f"{count} study sessions imported", fg="green")
+    click.echo(f"{elapsed:.2f}s, {count / elapsed if elapsed else 0:.0f} rows/s")
+
+
+@main.command()
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option("--format", "fileFormat", type=click.Choice(exporter.FORMATS),
+                help="Output format, detected from the file extension by default.")
+@click.pass_obj
+def export(db, path, fileFormat):
+    userID = checkUser(db)
+    fileFormat = fileFormat or exporter.detectFormat(path)
+    if not fileFormat:
+        click.secho("Unknown file format, use --format", fg="red")
+        sys.exit()
+
+    crud = CrudStudy()
+    with profiler.phase("fetch"):
+        result = crud.streamStudySessions(db, userID)
+    try:
+        with profiler.phase("render"):
+            count = exporter.writeRows(profiler.timed("fetch", result), path,
+                                        list(result.keys()), fileFormat,
+                                        exporter.columnTypes(
+                                            crud.selectStudySessionRows(
+                                                userID)))
+    except ImportError:
+        click.secho("Parquet export requires pyarrow", fg="red")
+        sys.exit()
+    click.secho(f"{count} study sessions exported", fg="green")
+
+
+@main.command()
+@click.option("--all-users", "allUsers", is_flag=True,
+                help="Write a report for every user, not only the logged one.")
+@click.option("--out", "directory", required=True,
+                type=click.Path(file_okay=False, writable=True),
+                help="Directory receiving one file per user.")
+@click.option("--format", "fileFormat", type=click.Choice(exporter.FORMATS),
+                default="csv", show_default=True)
+@click.option("--workers", type=click.IntRange(min=1),
+                help="Worker processes, one per CPU by default.")
+@click.option("--by", type=click.Choice(list(REPORT_BUCKETS)))
+@click.option("--since", type=click.DateTime(DATE_FORMATS))
+@click.option("--until", type=click.DateTime(DATE_FORMATS))
+@click.pass_obj
+def report(db, allUsers, directory, fileFormat, workers, by, since, until):
+    from transfer import reports
+
+    userID = checkUser(db)
+    users = reports.readUsers(db, None if allUsers else [userID])
+    start = time.perf_counter()
+    try:
+        files, rows = reports.writeReports(users, directory, fileFormat,
+                                            workers, url=str(engine.url),
+                                            by=by, since=since, until=until)
+    except ImportError:
+        click.secho("Parquet export requires pyarrow", fg="red")
+        sys.exit()
+    elapsed = time.perf_counter() - start
+    click.secho(f"{files} reports written to {directory}", fg="green")
+    click.echo(f"{rows} rows, {elapsed:.2f}s")
+
+
+@main.command()
+@click.option("--before", type=click.DateTime(DATE_FORMATS),
+                help="Move the study sessions started before this date into "
+                    "per-year archive files.")
+@click.option("--dir", "directory", default=None,
+                help="Where new archive files go, STUDY_ARCHIVE_DIR or an "
+                    "archive directory next to the database by default.")
+@click.pass_obj
+def archive(db, before, directory):
+    checkUser(db)
+    crud = CrudStudy()
+    if before:
+        try:
+            moved = crud.archiveStudySessions(db, before, directory)
+        except ValueError as error:
+            click.secho(str(error), fg="red")
+            sys.exit(1)
+        if not moved:
+            click.secho("No study sessions to archive", fg="red")
+        for year, count in moved:
+            click.secho(f"{count} study sessions archived in {year}",
+                        fg="green")
+
+    dbArchives = crud.readArchives(db)
+    if len(dbArchives) == 0:
+        click.secho("No archives", fg="red")
+        sys.exit()
+    echoTable(["Year", "Sessions", "First_Session", "Last_Session", "Path"],
+                [(entry.year, entry.rows,
+                    entry.first_start and entry.first_start.strftime(
+                        DATETIME_FORMAT),
+                    entry.last_start and entry.last_start.strftime(
+                        DATETIME_FORMAT),
+                    entry.path)
+                    for entry in dbArchives],
+                aligns=["right", "right", "left", "left", "left"])
+
+
+@main.command()
+@click.option("--rebuild", is_flag=True,
+                help="Copy every study session again instead of appending.")
+@click.option("--dir", "path", default=None,
+                help="Snapshot directory, STUDY_SNAPSHOT_DIR or ./snapshot "
+                    "by default.")
+@click.pass_obj
+def snapshot(db, rebuild, path):
+    try:
+        from analytics import snapshot as snapshots
+    except ImportError:
+        click.secho("Snapshots require numpy", fg="red")
+        sys.exit()
+
+    start = time.perf_counter()
+    appended, rows, rebuilt = snapshots.refresh(db,
+                                path or snapshots.SNAPSHOT_DIR, rebuild)
+    elapsed = time.perf_counter() - start
+    click.secho(f"{'Snapshot rebuilt' if rebuilt else 'Snapshot refreshed'}: "
+                f"{appended} study sessions appended, {rows} in total",
+                fg="green")
+    click.echo(f"{elapsed:.2f}s")
+
+
+@main.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8000, show_default=True)
+@click.option("--workers", default=1, show_default=True,
+                help="Worker processes, each with its own engine and cache.")
+def serve(host, port, workers):
+    import uvicorn
+    uvicorn.run("api:app", host=host, port=port, workers=workers,
+                log_level="warning")
+
+
+@main.command()
+def shell():
+    try:
+        import readline
+    except ImportError:
+        pass
+    shellState["active"] = True
+    click.echo("Type a command as you would after app.py, "
+                "--help for the list, exit to quit.")
+    while True:
+        try:
+            line = input("study> ")
+        except (EOFError, KeyboardInterrupt):
+            click.echo()
+            break
+        try:
+            args = shlex.split(line)
+        except ValueError as error:
+            click.secho(str(error), fg="red")
+            continue
+        if not args:
+            continue
+        if args[0] in ("exit", "quit"):
+            break
+        if args[0] == "shell":
+            continue
+        try:
+            main.main(args, prog_name="app.py", standalone_mode=False)
+        except click.exceptions.Abort:
+            click.echo("Aborted!")
+        except click.ClickException as error:
+            error.show()
+        except SystemExit:
+            pass
+    shellState["active"] = False
+    shellState["userID"] = None
 
 
 def createCategory(ctx, param, value):
     if not value or ctx.resilient_parsing:
         return
 
-    checkUser()
+    db = ctx.obj
+    checkUser(db)
     category = click.prompt("Category", type=str)
     crud = CrudCategory()
-    with DbHandler() as db:
-        dbCategory = crud.readCategoryByName(db, category)
-        if dbCategory:
-            click.secho("category already exists", fg="red")
-            ctx.abort()   
-    
+    dbCategory = crud.readCategoryByName(db, category)
+    if dbCategory:
+        click.secho("category already exists", fg="red")
+        ctx.abort()
+
     payload = schema.Category(name=category)
-    with DbHandler() as db:
-        crud.createCategory(db, payload)
-        click.secho("New category created", fg="green")
-        dbCategory = crud.readCategoryByName(db, category)
-        click.secho("Name: ", fg="blue", bold=True, nl=None)
-        click.echo(f"{dbCategory.name.title()}")
+    crud.createCategory(db, payload)
+    click.secho("New category created", fg="green")
+    dbCategory = crud.readCategoryByName(db, category)
+    click.secho("Name: ", fg="blue", bold=True, nl=None)
+    click.echo(f"{dbCategory.name.title()}")
     ctx.exit()
 
 
@@ -212,50 +609,46 @@ def deleteCategory(ctx, param, value):
 
     if not value or ctx.resilient_parsing:
         return
-    
-    checkUser()
+
+    db = ctx.obj
+    checkUser(db)
     category = click.prompt("Category", type=str)
     crud = CrudCategory()
-    with DbHandler() as db:
-        dbCategory = crud.readCategoryByName(db, category)
-        if not dbCategory:
-            click.secho("Category not found", fg="red")
-            ctx.abort()
-        categoryID = dbCategory.id
-        dbCourses = crud.readCoursesByCategory(db, categoryID)
-        if dbCourses:
-            click.secho("Course assigned to course", fg="red")
-            ctx.abort()
-        if click.confirm('Are you sure?', abort=True):
-            crud.deleteCategory(db, dbCategory)
-            click.secho("Category deleted", fg="green")
-        ctx.exit()
+    dbCategory = crud.readCategoryByName(db, category)
+    if not dbCategory:
+        click.secho("Category not found", fg="red")
+        ctx.abort()
+    categoryID = dbCategory.id
+    dbCourses = crud.readCoursesByCategory(db, categoryID)
+    if dbCourses:
+        click.secho("Course assigned to course", fg="red")
+        ctx.abort()
+    if click.confirm('Are you sure?', abort=True):
+        crud.deleteCategory(db, dbCategory)
+        click.secho("Category deleted", fg="green")
+    ctx.exit()
 
 
 @main.command()
-@click.option("--new", is_flag=True, callback=createCategory, 
+@click.option("--new", is_flag=True, callback=createCategory,
                 expose_value=False)
-@click.option("--delete", is_flag=True, callback=deleteCategory, 
+@click.option("--delete", is_flag=True, callback=deleteCategory,
                 expose_value=False)
-def category():
+@click.pass_obj
+def category(db):
 
-    checkUser()
+    checkUser(db)
     crud = CrudCategory()
-    with DbHandler() as db:
-        dbCategories = crud.readCategories(db)
-        listCategories = []
-        for category in dbCategories:
-          listCategories.append(schema.Category.from_orm(category).dict())   
+    with profiler.phase("fetch"):
+        dbCategories = crud.readCategoryRows(db)
 
-    if len(listCategories) == 0:
+    if len(dbCategories) == 0:
         click.secho("Categories not found", fg="red")
-        exit()
+        sys.exit()
 
-    df = pd.json_normalize(listCategories)
-    df.name = df.name.apply(lambda x: x.title())
-    df.rename(str.title, axis="columns", inplace=True)
-    click.echo(tabulate(df, headers="keys", showindex=False
-                        ,tablefmt="simple"))
+    with profiler.phase("frame"):
+        rows = [(row.id, row.name.title()) for row in dbCategories]
+    echoTable(["Id", "Name"], rows, aligns=["right", "left"])
 
 
 
@@ -263,37 +656,34 @@ def createCourse(ctx, param, value):
 
     if not value or ctx.resilient_parsing:
         return
-   
-    userID = checkUser()
+
+    db = ctx.obj
+    userID = checkUser(db)
     course = click.prompt("Course", type=str)
     crud = CrudCourse()
-    with DbHandler() as db:
-        dbCourse = crud.readCourseByName(db, course)
-        if dbCourse:
-            click.secho("Course already exists", fg="red")
-            ctx.abort()
-    
+    dbCourse = crud.readCourseByName(db, course)
+    if dbCourse:
+        click.secho("Course already exists", fg="red")
+        ctx.abort()
+
     category = click.prompt("Category", type=str)
     crud = CrudCategory()
-    with DbHandler() as db:
-        dbCategory = crud.readCategoryByName(db, category)
-        if not dbCategory:
-            click.secho("Category not found", fg="red")
-            ctx.abort()
-        categoryID = dbCategory.id
-    
+    categoryID = crud.readCategoryIdByName(db, category)
+    if not categoryID:
+        click.secho("Category not found", fg="red")
+        ctx.abort()
+
     payload = schema.BaseCourse(
         name = course,
         category_id = categoryID,
     )
     crud = CrudCourse()
-    with DbHandler() as db:
-        crud.createCourse(db, payload)
-        click.secho("New course created", fg="green")
-        dbCourse = crud.readCourseByName(db, course)
-        courseID = dbCourse.id
-        click.secho("Name: ", fg="blue", bold=True, nl=None)
-        click.echo(f"{dbCourse.name.title()}")
+    crud.createCourse(db, payload)
+    click.secho("New course created", fg="green")
+    dbCourse = crud.readCourseByName(db, course)
+    courseID = dbCourse.id
+    click.secho("Name: ", fg="blue", bold=True, nl=None)
+    click.echo(f"{dbCourse.name.title()}")
 
     if click.confirm("Do you want to subscribe?"):
         subscribed = click.prompt("Subscribed on", default=date.today())
@@ -307,9 +697,8 @@ def createCourse(ctx, param, value):
             conclusion_on = conclusion
         )
         crud = CrudSubscription()
-        with DbHandler() as db:
-            crud.createSubscription(db, payload)
-            click.secho("User subscribed", fg="green")
+        crud.createSubscription(db, payload)
+        click.secho("User subscribed", fg="green")
     ctx.exit()
 
 
@@ -318,53 +707,48 @@ def deleteCourse(ctx, param, value):
     if not value or ctx.resilient_parsing:
         return
 
-    checkUser()  
+    db = ctx.obj
+    checkUser(db)
     course = click.prompt("Course", type=str)
     crud = CrudCourse()
-    with DbHandler() as db:
-        dbCourse = crud.readCourseByName(db, course)
-        if not dbCourse:
-            click.secho("Course not found", fg="red")
-            ctx.abort()
-        courseID = dbCourse.id
+    dbCourse = crud.readCourseByName(db, course)
+    if not dbCourse:
+        click.secho("Course not found", fg="red")
+        ctx.abort()
+    courseID = dbCourse.id
     crud = CrudSubscription()
-    with DbHandler() as db:
-        dbSubscriptions = crud.readSubscriptionByCourse(db, courseID)
-        if dbSubscriptions:
-            click.secho("Course has users subscribed", fg="red")
-            ctx.abort()
-        if click.confirm('Are you sure?', abort=True):
-            crud.deleteCourse(db, dbCourse)
-            click.secho("Course delete", fg="green")
+    dbSubscriptions = crud.readSubscriptionByCourse(db, courseID)
+    if dbSubscriptions:
+        click.secho("Course has users subscribed", fg="red")
+        ctx.abort()
+    if click.confirm('Are you sure?', abort=True):
+        crud.deleteCourse(db, dbCourse)
+        click.secho("Course delete", fg="green")
     ctx.exit()
 
 @main.command()
-@click.option("--new", is_flag=True, callback=createCourse, 
+@click.option("--new", is_flag=True, callback=createCourse,
                 expose_value=False)
-@click.option("--delete", is_flag=True, callback=deleteCourse, 
+@click.option("--delete", is_flag=True, callback=deleteCourse,
                 expose_value=False)
-def course():
-    
-    checkUser()
+@click.pass_obj
+def course(db):
+
+    checkUser(db)
     crud = CrudCourse()
-    with DbHandler() as db:
-        dbCourses = crud.readCourses(db)
-        listCourses = []
-        for course in dbCourses:
-            listCourses.append(schema.Course.from_orm(course).dict()) 
-    
-    if len(listCourses) == 0:
+    with profiler.phase("fetch"):
+        dbCourses = crud.readCourseRows(db)
+
+    if len(dbCourses) == 0:
         click.secho("Courses not found", fg="red")
-        exit()
+        sys.exit()
+
+    with profiler.phase("frame"):
+        rows = [(row.id, row.name.title(), (row.category or "").title())
+                for row in dbCourses]
+    echoTable(["Id", "Name", "Category"], rows,
+                aligns=["right", "left", "left"])
 
-    df = pd.json_normalize(listCourses)
-    df.rename(columns={"category.name": "category"}, inplace=True)
-    df.category = df.category.apply(lambda x: x.title())
-    df.name = df.name.apply(lambda x: x.title())
-    df = df.reindex(columns=["id", "name", "category"])
-    df.rename(str.title, axis="columns", inplace=True)    
-    click.echo(tabulate(df, headers="keys", showindex=False ,tablefmt="simple"))
-    
 
 
 def createSubscription(ctx, param, value):
@@ -372,15 +756,14 @@ def createSubscription(ctx, param, value):
     if not value or ctx.resilient_parsing:
         return
 
-    userID = checkUser()
+    db = ctx.obj
+    userID = checkUser(db)
     course = click.prompt("Course", type=str)
     crud = CrudCourse()
-    with DbHandler() as db:
-        dbCourse = crud.readCourseByName(db, course)
-        if not dbCourse:
-            click.secho("Course not found", fg="red")
-            ctx.abort()
-        courseID = dbCourse.id
+    courseID = crud.readCourseIdByName(db, course)
+    if not courseID:
+        click.secho("Course not found", fg="red")
+        ctx.abort()
     subscribed = click.prompt("Subscribed on", default=date.today())
     conclusion = click.prompt("Conclusion on",
                                 default=date.today() + timedelta(weeks=24))
@@ -392,9 +775,8 @@ def createSubscription(ctx, param, value):
         conclusion_on = conclusion,
     )
     crud = CrudSubscription()
-    with DbHandler() as db:
-        crud.createSubscription(db, payload)
-        click.secho("User subscribed", fg="green")
+    crud.createSubscription(db, payload)
+    click.secho("User subscribed", fg="green")
     ctx.exit()
 
 
@@ -402,86 +784,73 @@ def deleteSubscription(ctx, param, value):
 
     if not value or ctx.resilient_parsing:
         return
-    
-    userID = checkUser()
+
+    db = ctx.obj
+    userID = checkUser(db)
     course = click.prompt("Course", type=str)
     crud = CrudCourse()
-    with DbHandler() as db:
-        dbCourse = crud.readCourseByName(db, course)
-        if not dbCourse:
-            click.secho("Course not found", fg="red")
-            ctx.abort()
-        courseID = dbCourse.id
-        crud = CrudSubscription()
-        with DbHandler() as db:
-            dbSubscription = crud.readSubscriptionByUserAndCourse(db, userID,
-                                                                    courseID)
-            if not dbSubscription:
-                click.secho("User not subscribed in this course", fg="red")
-                ctx.abort()
-            subscriptionID = dbSubscription.id
-        crud = CrudStudy()
-        with DbHandler() as db:
-            dbStudySessions = crud.readStudySessionsBySubscriptionId(db,
-                                                                subscriptionID)
-            if dbStudySessions:
-                click.secho("Subscription has study sessions ", fg="red")
-                ctx.abort()
-                if click.confirm('Are you sure?', abort=True):
-                    crud.deleteSubscription(db, dbSubscription)
-                    click.secho("Subscription deleted", fg="green")
+    courseID = crud.readCourseIdByName(db, course)
+    if not courseID:
+        click.secho("Course not found", fg="red")
+        ctx.abort()
+    crud = CrudSubscription()
+    dbSubscription = crud.readSubscriptionByUserAndCourse(db, userID, courseID)
+    if not dbSubscription:
+        click.secho("User not subscribed in this course", fg="red")
+        ctx.abort()
+    subscriptionID = dbSubscription.id
+    if CrudStudy().hasStudySessions(db, subscriptionID):
+        click.secho("Subscription has study sessions ", fg="red")
+        ctx.abort()
+    if click.confirm('Are you sure?', abort=True):
+        crud.deleteSubscription(db, dbSubscription)
+        click.secho("Subscription deleted", fg="green")
     ctx.exit()
 
 
 @main.command()
-@click.option("--new", is_flag=True, callback=createSubscription, 
+@click.option("--new", is_flag=True, callback=createSubscription,
                 expose_value=False)
-@click.option("--delete", is_flag=True, callback=deleteSubscription, 
+@click.option("--delete", is_flag=True, callback=deleteSubscription,
                 expose_value=False)
-def subscription():
+@click.pass_obj
+def subscription(db):
 
-    userID = checkUser()
+    userID = checkUser(db)
     crud = CrudSubscription()
-    with DbHandler() as db:
-        dbCourses = crud.readSubscriptions(db, userID)
-        listCourses = []
-        for course in dbCourses:
-            listCourses.append(schema.Subscription.from_orm(course).dict()) 
-    
-    if len(listCourses) == 0:
+    with profiler.phase("fetch"):
+        dbSubscriptions = crud.readSubscriptionRows(db, userID)
+
+    if len(dbSubscriptions) == 0:
         click.secho("No courses subscribed", fg="red")
-        exit()
+        sys.exit()
+
+    with profiler.phase("frame"):
+        rows = [(row.user.lower(), row.course.title(), row.category.title(),
+                    row.subscribed_on, row.conclusion_on)
+                for row in dbSubscriptions]
+    echoTable(["User", "Course", "Category", "Subscribed_On", "Conclusion_On"],
+                rows)
 
-    df = pd.json_normalize(listCourses)
-    df.rename(columns={"course.category.name": "category",
-            "user.email": "user", "course.name": "course"}, inplace=True)
-    df.course = df.course.apply(lambda x: x.title())
-    df.category = df.category.apply(lambda x: x.title())
-    df.user = df.user.apply(lambda x: x.lower())
-    df.rename(str.title, axis="columns", inplace=True)
-    df = df.reindex(columns=["User", "Course", "Category", "Subscribed_On",
-                            "Conclusion_On"])
-    click.echo(tabulate(df, headers="keys", showindex=False, tablefmt="simple"))
-    
 
 
 def createUser(ctx, param, value):
 
     if not value or ctx.resilient_parsing:
         return
-    
+
+    db = ctx.obj
     user = click.prompt("User", type=str)
     crud = CrudUser()
-    with DbHandler() as db:
-        dbUser = crud.readUserByName(db, user)
-        if dbUser:
-            click.secho("User already created")
-            ctx.abort()
-        payload = schema.User(
-            email = user.upper()
-        )            
-        crud.createUser(db, payload)
-        click.secho("New user created", fg="green")
+    dbUser = crud.readUserByName(db, user)
+    if dbUser:
+        click.secho("User already created")
+        ctx.abort()
+    payload = schema.User(
+        email = user.upper()
+    )
+    crud.createUser(db, payload)
+    click.secho("New user created", fg="green")
     ctx.exit()
 
 
@@ -490,35 +859,32 @@ def deleteUser(ctx, param, value):
 
     if not value or ctx.resilient_parsing:
         return
-    
+
+    db = ctx.obj
     user = click.prompt("User", type=str)
     crud = CrudSession()
-    with DbHandler() as db:
-        dbSession = crud.readActiveSession(db)
-        try:
-            userCurrentSession = dbSession.user_id
-        except AttributeError:
-            userCurrentSession = 0
+    dbSession = crud.readActiveSession(db)
+    try:
+        userCurrentSession = dbSession.user_id
+    except AttributeError:
+        userCurrentSession = 0
     crud = CrudUser()
-    with DbHandler() as db:
-        dbUser = crud.readUserByName(db, user)
-        if not dbUser:
-            click.secho("User not found", fg="red")
-            ctx.abort()
-        userID = dbUser.id
-        if userID == userCurrentSession:
-            click.secho("User has an active session", fg="red")
-            ctx.abort()
-    crud = CrudSubscription()
-    with DbHandler() as db:
-        dbSubscriptions = crud.readSubscriptionByUser(db, userID)
-        if dbSubscriptions:
-            click.secho("User has courses subscribed", fg="red")
-            ctx.abort()
-        if click.confirm('Are you sure?', abort=True):
-            crud.deleteUser(db, dbUser)
-            click.secho("User deleted", fg="green")
-        ctx.exit()
+    dbUser = crud.readUserByName(db, user)
+    if not dbUser:
+        click.secho("User not found", fg="red")
+        ctx.abort()
+    userID = dbUser.id
+    if userID == userCurrentSession:
+        click.secho("User has an active session", fg="red")
+        ctx.abort()
+    dbSubscriptions = CrudSubscription().readSubscriptionByUser(db, userID)
+    if dbSubscriptions:
+        click.secho("User has courses subscribed", fg="red")
+        ctx.abort()
+    if click.confirm('Are you sure?', abort=True):
+        crud.deleteUser(db, dbUser)
+        click.secho("User deleted", fg="green")
+    ctx.exit()
 
 
 @main.command()
@@ -526,59 +892,55 @@ def deleteUser(ctx, param, value):
                 expose_value=False)
 @click.option("--delete", is_flag=True, callback=deleteUser,
                 expose_value=False)
-def user():
+@click.pass_obj
+def user(db):
     crud = CrudUser()
-    with DbHandler() as db:
-        dbUsers = crud.readUsers(db)
-        listUsers = []
-        for user in dbUsers:
-          listUsers.append(schema.User.from_orm(user).dict())   
+    with profiler.phase("fetch"):
+        dbUsers = crud.readUserRows(db)
 
-    if len(listUsers) == 0:
+    if len(dbUsers) == 0:
         click.secho("Users not found", fg="red")
-        exit()
+        sys.exit()
+
+    with profiler.phase("frame"):
+        rows = [(row.id, row.email.lower()) for row in dbUsers]
+    echoTable(["Id", "Email"], rows, aligns=["right", "left"])
 
-    df = pd.json_normalize(listUsers)
-    df.rename(str.title, axis="columns", inplace=True)
-    df.Email = df.Email.apply(lambda x: x.lower())
-    click.echo(tabulate(df, headers="keys", showindex=False
-                        ,tablefmt="simple"))
-    
 
 def login(ctx, param, value):
 
     if not value or ctx.resilient_parsing:
         return
 
+    db = ctx.obj
     crud = CrudUser()
     user = click.prompt("User", type=str)
-    with DbHandler() as db:
-        dbUser = crud.readUserByName(db, user)
-        if not dbUser:
-            click.secho("user not found, please check or create a new one",
-                        fg="red")
-            ctx.exit()
-        else:
-            userID = dbUser.id
+    dbUser = crud.readUserByName(db, user)
+    if not dbUser:
+        click.secho("user not found, please check or create a new one",
+                    fg="red")
+        ctx.exit()
+    else:
+        userID = dbUser.id
 
     crud = CrudSession()
-    with DbHandler() as db:    
-        dbSession = crud.readActiveSession(db)
-        if dbSession:
-            if dbSession.user_id == userID:
-                click.secho("session already opened", fg="green")
-                ctx.exit()
-            else: 
-                click.secho("another user has an opened session, please logoff",
-                            fg="red")
-                ctx.exit()     
-        session = schema.Session(
-            user_id = dbUser.id,
-            opened_on = datetime.today(),
-            is_active = True
-        )                    
-        dbSession = crud.openSession(db, session)
-        click.secho("user logged on", fg="green")
+    dbSession = crud.readActiveSession(db)
+    if dbSession:
+        if dbSession.user_id == userID:
+            click.secho("session already opened", fg="green")
+            ctx.exit()
+        else:
+            click.secho("another user has an opened session, please logoff",
+                        fg="red")
+            ctx.exit()
+    session = schema.Session(
+        user_id = dbUser.id,
+        opened_on = datetime.today(),
+        is_active = True
+    )
+    dbSession = crud.openSession(db, session)
+    shellState["userID"] = None
+    click.secho("user logged on", fg="green")
     ctx.exit()
 
 
@@ -586,40 +948,39 @@ def logoff(ctx, param, value):
 
     if not value or ctx.resilient_parsing:
         return
-    
+
+    db = ctx.obj
     crud = CrudSession()
-    with DbHandler() as db:
-        dbSession = crud.readActiveSession(db)
-        if not dbSession:
-            click.secho("no session actived, please login", fg="red")
-            exit()
-        crud.closeSession(db, dbSession)
-        click.secho("session closed", fg="green")
+    dbSession = crud.readActiveSession(db)
+    if not dbSession:
+        click.secho("no session actived, please login", fg="red")
+        sys.exit()
+    crud.closeSession(db, dbSession)
+    shellState["userID"] = None
+    click.secho("session closed", fg="green")
     ctx.exit()
 
 
 @main.command()
 @click.option("--login", is_flag=True, callback=login, expose_value=False)
 @click.option("--logoff", is_flag=True, callback=logoff, expose_value=False)
-def session():
+@click.pass_obj
+def session(db):
 
     crud = CrudSession()
-    with DbHandler() as db:
+    with profiler.phase("fetch"):
         dbSession = crud.readActiveSession(db)
-        if not dbSession:
-            click.secho("no active session", fg="red")
-            exit()
+    if not dbSession:
+        click.secho("no active session", fg="red")
+        sys.exit()
 
-        session = schema.BaseSession.from_orm(dbSession).dict()
-        df = pd.json_normalize(session)
-        df.drop(["user.id",], inplace=True, axis=1)
-        df.rename(columns={"user.email": "user"}, inplace=True)
-        df.user = df.user.apply(lambda x: x.lower())
-        df.rename(str.title, axis="columns", inplace=True)
-        df = df.reindex(columns=["Id", "User", "Opened_On", "Is_Active"])
-        click.echo(tabulate(df, headers="keys", showindex=False
-                        ,tablefmt="simple"))
+    with profiler.phase("serialize"):
+        session = schema.BaseSession.from_orm(dbSession)
+    echoTable(["Id", "User", "Opened_On", "Is_Active"],
+                [(session.id, session.user.email.lower(),
+                    session.opened_on, session.is_active)],
+                aligns=["right", "left", "left", "left"])
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,456 @@
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+
+# Times every Crud method and the read-only CLI commands against generated
+# databases of several sizes. Each scale runs in its own interpreter, pointed
+# at its database through STUDY_DATABASE_URL, so engines, caches and peak
+# memory do not leak from one scale into the next. The study session readers
+# run a second time on a copy whose older half is moved to archive files.
+
+SCALES = {
+    "small": dict(users=10, categories=5, courses=20, subscriptions=5,
+                    sessions=10000),
+    "medium": dict(users=100, categories=10, courses=100, subscriptions=10,
+                    sessions=200000),
+    "large": dict(users=1000, categories=20, courses=500, subscriptions=10,
+                    sessions=2000000),
+}
+
+Case = namedtuple("Case", "name call setup", defaults=(None,))
+
+
+def consume(result):
+    # lists, generators and Result objects are read to the end, as a caller
+    # rendering them would
+    if hasattr(result, "__iter__") and not isinstance(result, (str, tuple)):
+        for _ in result:
+            pass
+
+
+def studyReadCases(fixture, prefix: str = ""):
+    # the study session readers: the ORM and row listings, the first page
+    # and one resumed from a cursor halfway through, and readReport through
+    # the daily rollup and over the raw sessions
+    from database import crud
+
+    study = crud.CrudStudy()
+    ids = [fixture["subscriptionID"]]
+    userID = fixture["userID"]
+    after = fixture["cursor"]
+    # starting within a day sends readReport to the raw sessions
+    since = after[0].replace(hour=12, minute=0, second=0, microsecond=0)
+    until = since + timedelta(days=90)
+
+    cases = [
+        Case("CrudStudy.readReport",
+                lambda db: study.readReport(db, userID)),
+        Case("CrudStudy.readReport by month",
+                lambda db: study.readReport(db, userID, "month")),
+        Case("CrudStudy.readReport by hour",
+                lambda db: study.readReport(db, userID, "hour")),
+        Case("CrudStudy.readReport since until",
+                lambda db: study.readReport(db, userID, since=since,
+                                            until=until)),
+        Case("CrudStudy.readStudySessions",
+                lambda db: study.readStudySessions(db, ids, strategy="joined")),
+        Case("CrudStudy.iterStudySessions",
+                lambda db: study.iterStudySessions(db, ids, strategy="joined")),
+        Case("CrudStudy.readStudySessionsPage",
+                lambda db: study.readStudySessionsPage(db, ids, 100,
+                                                        strategy="joined")),
+        Case("CrudStudy.readStudySessionsPage after",
+                lambda db: study.readStudySessionsPage(db, ids, 100,
+                                                        after=after,
+                                                        strategy="joined")),
+        Case("CrudStudy.iterStudySessionRows",
+                lambda db: study.iterStudySessionRows(db, ids)),
+        Case("CrudStudy.readStudySessionRowsPage",
+                lambda db: study.readStudySessionRowsPage(db, ids, 100)),
+        Case("CrudStudy.readStudySessionRowsPage after",
+                lambda db: study.readStudySessionRowsPage(db, ids, 100,
+                                                            after=after)),
+        Case("CrudStudy.streamStudySessions",
+                lambda db: study.streamStudySessions(db, userID)),
+        Case("CrudStudy.readStudySessionsBySubscriptionId",
+                lambda db: study.readStudySessionsBySubscriptionId(db, ids[0])),
+    ]
+    return [case._replace(name=prefix + case.name) for case in cases]
+
+
+def crudCases(fixture):
+    from database import crud
+    from database.models import Sessions, StudySession, Subscriptions
+    from schema import schema
+
+    study = crud.CrudStudy()
+    subscription = crud.CrudSubscription()
+    course = crud.CrudCourse()
+    category = crud.CrudCategory()
+    user = crud.CrudUser()
+    session = crud.CrudSession()
+    start = datetime(2024, 1, 1, 8)
+    payload = schema.BaseStudySession(subscription_id=fixture["subscriptionID"],
+                                        start_session=start,
+                                        end_session=start + timedelta(hours=1))
+    ids = [fixture["subscriptionID"]]
+
+    return studyReadCases(fixture) + [
+        Case("CrudStudy.createStudySession",
+                lambda db: study.createStudySession(db, payload)),
+        Case("CrudStudy.bulkCreate",
+                lambda db: study.bulkCreate(db, [payload] * 1000)),
+        Case("CrudStudy.deleteStudySession",
+                lambda db, row: study.deleteStudySession(db, row),
+                lambda db: db.query(StudySession).get(fixture["studySessionID"])),
+        Case("CrudStudy.rebuildDailyRollup",
+                lambda db: study.rebuildDailyRollup(db)),
+        Case("CrudSubscription.readSubscriptions",
+                lambda db: subscription.readSubscriptions(db, fixture["userID"],
+                                                            strategy="joined")),
+        Case("CrudSubscription.readSubscriptionRows",
+                lambda db: subscription.readSubscriptionRows(db,
+                                                            fixture["userID"])),
+        Case("CrudSubscription.readSubscriptionByUserAndCourse",
+                lambda db: subscription.readSubscriptionByUserAndCourse(
+                    db, fixture["userID"], fixture["courseID"])),
+        Case("CrudSubscription.readSubscriptionByCourse",
+                lambda db: subscription.readSubscriptionByCourse(
+                    db, fixture["courseID"])),
+        Case("CrudSubscription.readSubscriptionByUser",
+                lambda db: subscription.readSubscriptionByUser(
+                    db, fixture["userID"], strategy="joined")),
+        Case("CrudSubscription.createSubscription",
+                lambda db: subscription.createSubscription(db,
+                    schema.BaseSubscription(course_id=fixture["courseID"],
+                                            user_id=fixture["userID"]))),
+        Case("CrudSubscription.deleteSubscription",
+                lambda db, row: subscription.deleteSubscription(db, row),
+                lambda db: db.query(Subscriptions).get(ids[0])),
+        Case("CrudCourse.readCourseByID",
+                lambda db: course.readCourseByID(db, fixture["courseID"])),
+        Case("CrudCourse.readCourseByName",
+                lambda db: course.readCourseByName(db, fixture["course"])),
+        Case("CrudCourse.readCourseIdByName",
+                lambda db: course.readCourseIdByName(db, fixture["course"])),
+        Case("CrudCourse.readCourses",
+                lambda db: course.readCourses(db)),
+        Case("CrudCourse.readCourseRows",
+                lambda db: course.readCourseRows(db)),
+        Case("CrudCourse.createCourse",
+                lambda db: course.createCourse(db,
+                    schema.BaseCourse(name="BENCHMARK",
+                                        category_id=fixture["categoryID"]))),
+        Case("CrudCourse.deleteCourse",
+                lambda db, row: course.deleteCourse(db, row),
+                lambda db: course.readCourseByID(db, fixture["courseID"])),
+        Case("CrudCategory.readCategoryByID",
+                lambda db: category.readCategoryByID(db, fixture["categoryID"])),
+        Case("CrudCategory.readCategoryByName",
+                lambda db: category.readCategoryByName(db, fixture["category"])),
+        Case("CrudCategory.readCategoryIdByName",
+                lambda db: category.readCategoryIdByName(db,
+                                                        fixture["category"])),
+        Case("CrudCategory.readCoursesByCategory",
+                lambda db: category.readCoursesByCategory(db,
+                                                        fixture["categoryID"])),
+        Case("CrudCategory.readCategories",
+                lambda db: category.readCategories(db)),
+        Case("CrudCategory.readCategoryRows",
+                lambda db: category.readCategoryRows(db)),
+        Case("CrudCategory.createCategory",
+                lambda db: category.createCategory(db,
+                    schema.Category(name="BENCHMARK"))),
+        Case("CrudCategory.deleteCategory",
+                lambda db, row: category.deleteCategory(db, row),
+                lambda db: category.readCategoryByID(db, fixture["categoryID"])),
+        Case("CrudUser.readUserByID",
+                lambda db: user.readUserByID(db, fixture["userID"])),
+        Case("CrudUser.readUserByName",
+                lambda db: user.readUserByName(db, fixture["email"])),
+        Case("CrudUser.readUserIdByName",
+                lambda db: user.readUserIdByName(db, fixture["email"])),
+        Case("CrudUser.readUsers",
+                lambda db: user.readUsers(db)),
+        Case("CrudUser.readUserRows",
+                lambda db: user.readUserRows(db)),
+        Case("CrudUser.createUser",
+                lambda db: user.createUser(db, schema.User(email="BENCHMARK"))),
+        Case("CrudUser.deleteUser",
+                lambda db, row: user.deleteUser(db, row),
+                lambda db: user.readUserByID(db, fixture["userID"])),
+        Case("CrudSession.readActiveSession",
+                lambda db: session.readActiveSession(db)),
+        Case("CrudSession.openSession",
+                lambda db: session.openSession(db,
+                    schema.Session(user_id=fixture["userID"],
+                                    opened_on=start))),
+        Case("CrudSession.closeSession",
+                lambda db, row: session.closeSession(db, row),
+                lambda db: db.query(Sessions).get(fixture["sessionID"])),
+    ]
+
+
+def cliCases(fixture, scratch):
+    from click.testing import CliRunner
+    import app
+
+    def invoke(args, input=None):
+        def call(db):
+            result = CliRunner().invoke(app.main, args, input=input)
+            if result.exit_code != 0:
+                raise RuntimeError(f"app.py {' '.join(args)} failed: "
+                                    f"{result.output or result.exception}")
+        return call
+
+    course = fixture["course"] + "\n"
+    return [
+        Case("app.py study", invoke(["study"], course)),
+        Case("app.py study --limit 100", invoke(["study", "--limit", "100"],
+                                                course)),
+        Case("app.py study --report", invoke(["study", "--report"])),
+        Case("app.py course", invoke(["course"])),
+        Case("app.py category", invoke(["category"])),
+        Case("app.py subscription", invoke(["subscription"])),
+        Case("app.py user", invoke(["user"])),
+        Case("app.py session", invoke(["session"])),
+        Case("app.py export", invoke(["export",
+                                        os.path.join(scratch, "export.csv")])),
+    ]
+
+
+def readFixture(db):
+    # the logged user and its busiest subscription drive every case
+    from sqlalchemy import func
+    from database.models import Courses, Sessions, StudySession, Subscriptions
+    from database.models import Users
+
+    activeSession = db.query(Sessions).filter(Sessions.is_active==True).first()
+    userID = activeSession.user_id
+    subscriptionID, count = db.query(StudySession.subscription_id,
+                                        func.count(StudySession.id)).\
+        join(Subscriptions, StudySession.subscription_id==Subscriptions.id).\
+        filter(Subscriptions.user_id==userID).\
+        group_by(StudySession.subscription_id).\
+        order_by(func.count(StudySession.id).desc()).first()
+    dbSubscription = db.query(Subscriptions).get(subscriptionID)
+    dbCourse = db.query(Courses).get(dbSubscription.course_id)
+    middle = db.query(StudySession.start_session, StudySession.id).\
+        filter(StudySession.subscription_id==subscriptionID).\
+        order_by(StudySession.start_session, StudySession.id).\
+        offset(count // 2).first()
+    return {
+        "userID": userID,
+        "email": db.query(Users).get(userID).email,
+        "sessionID": activeSession.id,
+        "subscriptionID": subscriptionID,
+        "courseID": dbCourse.id,
+        "course": dbCourse.name,
+        "categoryID": dbCourse.category_id,
+        "category": dbCourse.category.name,
+        "studySessionID": db.query(func.max(StudySession.id)).\
+            filter(StudySession.subscription_id==subscriptionID).scalar(),
+        "cursor": (middle.start_session, middle.id),
+    }
+
+
+def archivedCopy(path: str, scratch: str, before: datetime):
+    """Copy the database at ``path`` into ``scratch`` and archive the study
+    sessions started before ``before``, returning the copy's engine."""
+    from sqlalchemy.orm import sessionmaker
+    from database.archive import archiveSessions
+    from database.db import createEngine
+
+    copy = os.path.join(scratch, "archived.db")
+    with sqlite3.connect(path) as source, sqlite3.connect(copy) as target:
+        source.backup(target)
+    engine = createEngine(f"sqlite:///{copy}")
+    with sessionmaker(bind=engine)() as db:
+        archiveSessions(db, before, os.path.join(scratch, "archive"))
+        db.commit()
+    return engine
+
+
+def runCase(case, SessionLocal, lookupCache, counter, traced: bool):
+    # every run starts with a cold lookup cache and is rolled back, so write
+    # cases leave the database as they found it
+    lookupCache.entries.clear()
+    lookupCache.version = None
+    db = SessionLocal()
+    try:
+        args = (case.setup(db),) if case.setup else ()
+        counter.reset()
+        if traced:
+            tracemalloc.start()
+        start = time.perf_counter()
+        consume(case.call(db, *args))
+        elapsed = time.perf_counter() - start
+        peak = 0
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return elapsed, counter.count, peak
+    finally:
+        db.rollback()
+        db.close()
+
+
+def runScale(path: str, repeat: int):
+    """Run every case against the database at ``path`` in this process."""
+    os.environ["STUDY_DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.pop("STUDY_LOOKUP_CACHE", None)
+    from sqlalchemy.orm import sessionmaker
+    from database.db import SessionLocal, engine
+    from database.cache import lookupCache
+    from profiling.profiler import QueryStats
+
+    counter = QueryStats().install(engine)
+    with SessionLocal() as db:
+        fixture = readFixture(db)
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        archivedEngine = archivedCopy(path, scratch, fixture["cursor"][0])
+        archivedSession = sessionmaker(bind=archivedEngine)
+        archivedCounter = QueryStats().install(archivedEngine)
+        runs = [(case, SessionLocal, counter)
+                for case in crudCases(fixture) + cliCases(fixture, scratch)]
+        runs += [(case, archivedSession, archivedCounter)
+                    for case in studyReadCases(fixture, "archived ")]
+        for case, sessionFactory, caseCounter in runs:
+            timings = [runCase(case, sessionFactory, lookupCache, caseCounter,
+                                False)[0]
+                        for _ in range(repeat)]
+            _, queries, peak = runCase(case, sessionFactory, lookupCache,
+                                        caseCounter, True)
+            results[case.name] = {
+                "median": statistics.median(timings),
+                "max": max(timings),
+                "queries": queries,
+                "peak": peak,
+            }
+        archivedEngine.dispose()
+    return results
+
+
+def prepare(scale: str, dataDir: str, regenerate: bool):
+    from benchmark.generate import generate
+
+    path = os.path.join(dataDir, f"{scale}.db")
+    if regenerate or not os.path.exists(path):
+        os.makedirs(dataDir, exist_ok=True)
+        click.echo(f"Generating {scale} database...", err=True)
+        generate(path, **SCALES[scale])
+    return path
+
+
+def echoResults(scale, results, baseline=None):
+    from render.table import renderTable
+
+    headers = ["Case", "Median_ms", "Max_ms", "Queries", "Peak_KiB"]
+    if baseline is not None:
+        headers.append("Vs_Baseline")
+    rows = []
+    for name, result in results.items():
+        row = [name, f"{result['median'] * 1000:.2f}",
+                f"{result['max'] * 1000:.2f}", result["queries"],
+                f"{result['peak'] / 1024:.0f}"]
+        if baseline is not None:
+            previous = baseline.get(name)
+            row.append(f"{result['median'] / previous['median']:.2f}x"
+                        if previous and previous["median"] else "")
+        rows.append(row)
+    click.secho(f"\n{scale} ({SCALES[scale]['sessions']} study sessions)",
+                fg="blue", bold=True)
+    for line in renderTable(headers, rows,
+                            aligns=["left"] + ["right"] * (len(headers) - 1)):
+        click.echo(line)
+
+
+def findRegressions(results, baseline, tolerance: float, floor: float):
+    # a case regresses when it is slower than the baseline by more than
+    # ``tolerance`` and by more than ``floor`` seconds, or issues more queries
+    regressions = []
+    for scale, cases in results.items():
+        for name, result in cases.items():
+            previous = baseline.get(scale, {}).get(name)
+            if not previous:
+                continue
+            slower = result["median"] > previous["median"] * tolerance and \
+                result["median"] - previous["median"] > floor
+            if slower or result["queries"] > previous["queries"]:
+                regressions.append(f"{scale} {name}: "
+                    f"{previous['median'] * 1000:.2f} -> "
+                    f"{result['median'] * 1000:.2f} ms, "
+                    f"{previous['queries']} -> {result['queries']} queries")
+    return regressions
+
+
+@click.command()
+@click.option("--scale", "scales", multiple=True, show_default=True,
+                type=click.Choice(list(SCALES)), default=["small", "medium"])
+@click.option("--repeat", default=5, show_default=True,
+                type=click.IntRange(min=1))
+@click.option("--data-dir", "dataDir", default=os.path.join("benchmark", "data"),
+                show_default=True, help="Where generated databases are kept.")
+@click.option("--regenerate", is_flag=True,
+                help="Generate the databases again even if they exist.")
+@click.option("--save", type=click.Path(dir_okay=False, writable=True),
+                help="Write the results to this baseline file.")
+@click.option("--compare", type=click.Path(exists=True, dir_okay=False),
+                help="Compare with a baseline file, failing on regressions.")
+@click.option("--tolerance", default=1.25, show_default=True,
+                help="Allowed slowdown over the baseline median.")
+@click.option("--floor", default=0.002, show_default=True,
+                help="Slowdowns under this many seconds are ignored.")
+@click.option("--run", "runPath", hidden=True,
+                type=click.Path(exists=True, dir_okay=False))
+def main(scales, repeat, dataDir, regenerate, save, compare, tolerance, floor,
+            runPath):
+    if runPath:
+        click.echo(json.dumps(runScale(runPath, repeat)))
+        return
+
+    baseline = {}
+    if compare:
+        with open(compare) as file:
+            baseline = json.load(file)["results"]
+    results = {}
+    for scale in scales:
+        path = prepare(scale, dataDir, regenerate)
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmark.bench", "--run", path,
+                "--repeat", str(repeat)],
+            check=True, capture_output=True, text=True).stdout
+        results[scale] = json.loads(output)
+        echoResults(scale, results[scale],
+                    baseline.get(scale) if compare else None)
+
+    if save:
+        with open(save, "w") as file:
+            json.dump({"created": datetime.now().isoformat(timespec="seconds"),
+                        "repeat": repeat, "scales": {scale: SCALES[scale]
+                                                        for scale in scales},
+                        "results": results}, file, indent=2)
+        click.secho(f"Baseline saved to {save}", fg="green")
+    if compare:
+        regressions = findRegressions(results, baseline, tolerance, floor)
+        if regressions:
+            click.secho("Regressions:", fg="red")
+            for regression in regressions:
+                click.echo(f"  {regression}")
+            sys.exit(1)
+        click.secho("No regressions against the baseline", fg="green")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+
+# Several processes writing study sessions to one database at once, each
+# commit its own transaction, as concurrent CLI runs or API workers would.
+# Lock wait is the time a write spends in the Crud call, where BEGIN
+# IMMEDIATE waits for the write lock and locked writes are retried; the
+# insert itself is a small part of it.
+
+FIRST_DAY = datetime(2024, 1, 1)
+
+
+def percentile(values: list, q: float):
+    # nearest rank
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+def writer(path: str, profile: str, busyTimeout: int, writes: int,
+            hold: float, seed: int, startAt: float):
+    """Write ``writes`` study sessions, returning the lock waits, the
+    transaction times, the retries, the failures and when it finished."""
+    from sqlalchemy import select
+    from sqlalchemy.exc import OperationalError
+
+    from database.crud import CrudStudy
+    from database.db import SessionLocal, createEngine
+    from database.handler import DbHandler
+    from database.models import Subscriptions
+    from schema import schema
+
+    # the pool may fork after database.db was imported, so the engine is
+    # bound here rather than through STUDY_DATABASE_URL
+    pragmas = {} if busyTimeout is None else {"busy_timeout": busyTimeout}
+    SessionLocal.configure(bind=createEngine(f"sqlite:///{path}", profile,
+                                                **pragmas))
+    with DbHandler() as db:
+        subscriptions = db.execute(select(Subscriptions.id)).scalars().all()
+    generator = random.Random(seed)
+    crud = CrudStudy()
+    waits, transactions = [], []
+    retries = failures = 0
+
+    time.sleep(max(0.0, startAt - time.time()))
+    for _ in range(writes):
+        start = FIRST_DAY + timedelta(minutes=generator.randrange(525600))
+        payload = schema.BaseStudySession(
+            subscription_id=generator.choice(subscriptions),
+            start_session=start,
+            end_session=start + timedelta(minutes=generator.randrange(5, 120)))
+        began = time.perf_counter()
+        try:
+            with DbHandler() as db:
+                crud.createStudySession(db, payload)
+                waits.append(time.perf_counter() - began)
+                retries += db.info.get("lockRetries", 0)
+                if hold:
+                    time.sleep(hold)
+        except OperationalError:
+            failures += 1
+            continue
+        transactions.append(time.perf_counter() - began)
+    return waits, transactions, retries, failures, time.time()
+
+
+def run(path: str, processes: int, writes: int, hold: float,
+        profile: str, busyTimeout: int = None):
+    startAt = time.time() + 1.0 + 0.2 * processes
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(writer, path, profile, busyTimeout, writes,
+                                hold, seed, startAt)
+                    for seed in range(processes)]
+        results = [future.result() for future in futures]
+    waits = [wait for result in results for wait in result[0]]
+    transactions = [seconds for result in results for seconds in result[1]]
+    elapsed = max(result[4] for result in results) - startAt
+    return {
+        "committed": len(transactions),
+        "retries": sum(result[2] for result in results),
+        "failures": sum(result[3] for result in results),
+        "elapsed": elapsed,
+        "throughput": len(transactions) / elapsed if elapsed > 0 else 0.0,
+        "waits": waits,
+        "transactions": transactions,
+    }
+
+
+@click.command()
+@click.option("--processes", "processList", default="1,2,4,8",
+                show_default=True, help="Comma separated writer counts to run.")
+@click.option("--writes", default=200, show_default=True,
+                type=click.IntRange(min=1), help="Writes per process.")
+@click.option("--hold", default=0.0, show_default=True,
+                help="Milliseconds each transaction stays open after writing.")
+@click.option("--profile", default="durable", show_default=True,
+                type=click.Choice(["durable", "fast"]))
+@click.option("--busy-timeout", "busyTimeout", type=int,
+                help="Override the profile's busy_timeout, in milliseconds.")
+@click.option("--database", type=click.Path(exists=True, dir_okay=False),
+                help="Write to a copy of this database instead of a "
+                        "generated one.")
+def main(processList, writes, hold, profile, busyTimeout, database):
+    import shutil
+
+    from benchmark.generate import generate
+    from render.table import renderTable
+
+    counts = [int(count) for count in processList.split(",")]
+    rows = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for count in counts:
+            path = os.path.join(scratch, f"contention{count}.db")
+            if database:
+                shutil.copyfile(database, path)
+            else:
+                generate(path, sessions=1000)
+            result = run(path, count, writes, hold / 1000, profile,
+                            busyTimeout)
+            waits = [wait * 1000 for wait in result["waits"]]
+            rows.append([count, result["committed"], result["failures"],
+                            result["retries"], f"{result['throughput']:.0f}",
+                            *(f"{percentile(waits, q):.2f}"
+                                for q in (50, 90, 99)),
+                            f"{max(waits, default=0):.2f}",
+                            f"{percentile(result['transactions'], 99) * 1000:.2f}"])
+    headers = ["Processes", "Committed", "Failed", "Retries", "Writes_s",
+                "Wait_p50_ms", "Wait_p90_ms", "Wait_p99_ms", "Wait_max_ms",
+                "Txn_p99_ms"]
+    for line in renderTable(headers, rows, aligns=["right"] * len(headers)):
+        click.echo(line)
+
+
+if __name__ == "__main__":
+    main()
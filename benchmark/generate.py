@@ -0,0 +1,131 @@
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+import click
+
+from database.db import createEngine
+from database import migrations, rollup
+from database.models import Categories, Courses, Sessions, StudySession
+from database.models import Subscriptions, Users
+
+# Builds a scratch database with the application schema and synthetic data.
+# Names follow the same upper case convention as the Crud layer, so the CLI
+# can be pointed at the file with STUDY_DATABASE_URL.
+
+FIRST_DAY = datetime(2020, 1, 1)
+
+
+def userEmail(number: int):
+    return f"USER{number}@EXAMPLE.COM"
+
+
+def courseName(number: int):
+    return f"COURSE{number}"
+
+
+def categoryName(number: int):
+    return f"CATEGORY{number}"
+
+
+def insertBatches(connection, table, rows, batchSize: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batchSize:
+            connection.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        connection.execute(table.insert(), batch)
+
+
+def generate(path: str, users: int = 10, categories: int = 5,
+                courses: int = 20, subscriptions: int = 5,
+                sessions: int = 100000, days: int = 730, seed: int = 0,
+                batchSize: int = 10000):
+    """Create ``path`` and fill it, returning the number of study sessions.
+
+    ``subscriptions`` is the number of courses each user is subscribed to.
+    Sessions are spread at random over the subscriptions and over ``days``
+    days starting at FIRST_DAY. The first user is left logged in.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    generator = random.Random(seed)
+    engine = createEngine(f"sqlite:///{path}", profile="fast")
+    migrations.upgrade(engine)
+    subscriptions = min(subscriptions, courses)
+
+    with engine.begin() as connection:
+        connection.execute(Categories.__table__.insert(), [
+            {"id": number, "name": categoryName(number)}
+            for number in range(1, categories + 1)])
+        connection.execute(Courses.__table__.insert(), [
+            {"id": number, "name": courseName(number),
+                "category_id": generator.randint(1, categories)}
+            for number in range(1, courses + 1)])
+        connection.execute(Users.__table__.insert(), [
+            {"id": number, "email": userEmail(number)}
+            for number in range(1, users + 1)])
+
+        subscriptionRows = []
+        for userID in range(1, users + 1):
+            for courseID in generator.sample(range(1, courses + 1),
+                                                subscriptions):
+                subscriptionRows.append({
+                    "id": len(subscriptionRows) + 1,
+                    "course_id": courseID,
+                    "user_id": userID,
+                    "subscribed_on": date(2020, 1, 1),
+                    "conclusion_on": date(2020, 1, 1) + timedelta(weeks=24),
+                })
+        connection.execute(Subscriptions.__table__.insert(), subscriptionRows)
+        connection.execute(Sessions.__table__.insert(), [
+            {"user_id": 1, "opened_on": FIRST_DAY, "is_active": True}])
+
+        def studySessions():
+            span = days * 86400
+            for _ in range(sessions):
+                start = FIRST_DAY + timedelta(
+                    seconds=generator.randrange(span))
+                end = start + timedelta(
+                    seconds=generator.randint(5 * 60, 3 * 3600))
+                yield {
+                    "subscription_id":
+                        generator.randint(1, len(subscriptionRows)),
+                    **StudySession.columnsFor(start, end),
+                }
+
+        insertBatches(connection, StudySession.__table__, studySessions(),
+                        batchSize)
+        rollup.rebuild(connection)
+        connection.exec_driver_sql("ANALYZE")
+    engine.dispose()
+    return sessions
+
+
+@click.command()
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option("--users", default=10, show_default=True)
+@click.option("--categories", default=5, show_default=True)
+@click.option("--courses", default=20, show_default=True)
+@click.option("--subscriptions", default=5, show_default=True,
+                help="Courses each user is subscribed to.")
+@click.option("--sessions", default=100000, show_default=True)
+@click.option("--days", default=730, show_default=True,
+                help="Days over which the sessions are spread.")
+@click.option("--seed", default=0, show_default=True)
+def main(path, users, categories, courses, subscriptions, sessions, days,
+            seed):
+    start = time.perf_counter()
+    count = generate(path, users, categories, courses, subscriptions,
+                        sessions, days, seed)
+    elapsed = time.perf_counter() - start
+    click.secho(f"{count} study sessions generated in {path}", fg="green")
+    click.echo(f"{elapsed:.2f}s, {count / elapsed if elapsed else 0:.0f} rows/s")
+    click.echo(f"Use it with STUDY_DATABASE_URL=sqlite:///{path}")
+
+
+if __name__ == "__main__":
+    main()
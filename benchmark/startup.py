@@ -0,0 +1,67 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import click
+
+HEAVY_MODULES = ["pandas", "numpy", "tabulate"]
+
+CHECK = (
+    "import sys, app; "
+    "print(','.join(m for m in {heavy!r} if m in sys.modules))"
+)
+
+
+def timeCommand(args, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+@click.command()
+@click.option("--runs", default=10, show_default=True)
+@click.option("--budget", default=0.5, show_default=True,
+                help="Maximum seconds spent importing app over a bare interpreter.")
+@click.option("--save", type=click.Path(dir_okay=False, writable=True),
+                help="Record the measured startup in this baseline file.")
+@click.option("--compare", type=click.Path(exists=True, dir_okay=False),
+                help="Budget the startup recorded in a baseline file instead, "
+                    "times --tolerance.")
+@click.option("--tolerance", default=1.15, show_default=True,
+                help="Allowed slowdown over the baseline startup.")
+def main(runs, budget, save, compare, tolerance):
+    loaded = subprocess.run(
+        [sys.executable, "-c", CHECK.format(heavy=HEAVY_MODULES)],
+        check=True, capture_output=True, text=True).stdout.strip()
+    if loaded:
+        click.secho(f"Heavy modules imported at startup: {loaded}", fg="red")
+        sys.exit(1)
+
+    bare = timeCommand([sys.executable, "-c", "pass"], runs)
+    cold = timeCommand([sys.executable, "-c", "import app"], runs)
+    startup = cold - bare
+    if compare:
+        with open(compare) as file:
+            budget = json.load(file)["startup"] * tolerance
+    click.echo(f"interpreter: {bare * 1000:.1f} ms")
+    click.echo(f"import app:  {cold * 1000:.1f} ms")
+    click.echo(f"startup:     {startup * 1000:.1f} ms (budget {budget * 1000:.0f} ms)")
+    if save:
+        with open(save, "w") as file:
+            json.dump({"created": datetime.now().isoformat(timespec="seconds"),
+                        "runs": runs, "startup": startup}, file, indent=2)
+        click.secho(f"Baseline saved to {save}", fg="green")
+    if startup > budget:
+        click.secho("Cold start regressed", fg="red")
+        sys.exit(1)
+    click.secho("Cold start within budget", fg="green")
+
+
+if __name__ == "__main__":
+    main()
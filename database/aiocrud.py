@@ -0,0 +1,244 @@
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import archive
+from database.crud import CrudCategory, CrudCourse, CrudSession, CrudUser
+from database.crud import CrudStudy, CrudSubscription
+from database.models import Courses, Categories, Sessions, Users, Subscriptions, StudySession
+from schema import schema
+
+# Async counterparts of database.crud. Queries run through
+# AsyncSession.run_sync on the same CRUD code, so both layers share models,
+# rollup maintenance and the lookup cache. Relationships cannot be lazy
+# loaded from async code, so reads that return object graphs default to
+# selectin loading.
+
+
+class AsyncCrudStudy:
+    crud = CrudStudy()
+
+    async def readReport(self, db: AsyncSession, user_id: int, by: str = None,
+                            since: datetime = None, until: datetime = None):
+        return await db.run_sync(self.crud.readReport, user_id, by, since, until)
+
+
+    async def readStudySessions(self, db: AsyncSession, ids: list,
+                                strategy: str = "selectin"):
+        return await db.run_sync(self.crud.readStudySessions, ids, strategy)
+
+
+    async def readStudySessionsPage(self, db: AsyncSession, ids: list,
+                                    limit: int, since: datetime = None,
+                                    until: datetime = None, after: tuple = None,
+                                    strategy: str = "selectin"):
+        return await db.run_sync(self.crud.readStudySessionsPage, ids, limit,
+                                    since, until, after, strategy)
+
+
+    async def readStudySessionRowsPage(self, db: AsyncSession, ids: list,
+                                        limit: int, since: datetime = None,
+                                        until: datetime = None,
+                                        after: tuple = None):
+        return await db.run_sync(self.crud.readStudySessionRowsPage, ids, limit,
+                                    since, until, after)
+
+
+    async def streamStudySessions(self, db: AsyncSession, user_id: int,
+                                    batchSize: int = 10000):
+        tables = await db.run_sync(archive.sessionTables)
+        statement = self.crud.selectStudySessionRows(user_id, tables).\
+            execution_options(yield_per=batchSize)
+        return await db.stream(statement)
+
+
+    async def hasStudySessions(self, db: AsyncSession, subscription_id: int):
+        return await db.run_sync(self.crud.hasStudySessions, subscription_id)
+
+
+    async def archiveStudySessions(self, db: AsyncSession, before: datetime,
+                                    directory: str = None):
+        return await db.run_sync(self.crud.archiveStudySessions, before,
+                                    directory)
+
+
+    async def readArchives(self, db: AsyncSession):
+        return await db.run_sync(self.crud.readArchives)
+
+
+    async def readStudySessionsBySubscriptionId(self, db: AsyncSession, id: int,
+                                                strategy: str = "selectin"):
+        return await db.run_sync(self.crud.readStudySessionsBySubscriptionId,
+                                    id, strategy)
+
+
+    async def createStudySession(self, db: AsyncSession,
+                                    payload: schema.BaseStudySession):
+        return await db.run_sync(self.crud.createStudySession, payload)
+
+
+    async def bulkCreate(self, db: AsyncSession,
+                            payloads: Iterable[schema.BaseStudySession],
+                            batchSize: int = 5000):
+        return await db.run_sync(self.crud.bulkCreate, payloads, batchSize)
+
+
+    async def deleteStudySession(self, db: AsyncSession, payload: StudySession):
+        return await db.run_sync(self.crud.deleteStudySession, payload)
+
+
+    async def rebuildDailyRollup(self, db: AsyncSession):
+        return await db.run_sync(self.crud.rebuildDailyRollup)
+
+
+
+class AsyncCrudSubscription:
+    crud = CrudSubscription()
+
+    async def readSubscriptions(self, db: AsyncSession, user_id: int,
+                                strategy: str = "selectin"):
+        return await db.run_sync(self.crud.readSubscriptions, user_id, strategy)
+
+
+    async def readSubscriptionRows(self, db: AsyncSession, user_id: int):
+        return await db.run_sync(self.crud.readSubscriptionRows, user_id)
+
+
+    async def readSubscriptionByUserAndCourse(self, db: AsyncSession,
+                                                user_id: int, course_id: int):
+        return await db.run_sync(self.crud.readSubscriptionByUserAndCourse,
+                                    user_id, course_id)
+
+
+    async def readSubscriptionByCourse(self, db: AsyncSession, course_id: int):
+        return await db.run_sync(self.crud.readSubscriptionByCourse, course_id)
+
+
+    async def readSubscriptionByUser(self, db: AsyncSession, user_id: int,
+                                        strategy: str = "selectin"):
+        return await db.run_sync(self.crud.readSubscriptionByUser, user_id,
+                                    strategy)
+
+
+    async def createSubscription(self, db: AsyncSession,
+                                    payload: schema.BaseSubscription):
+        return await db.run_sync(self.crud.createSubscription, payload)
+
+
+    async def deleteSubscription(self, db: AsyncSession, payload: Subscriptions):
+        return await db.run_sync(self.crud.deleteSubscription, payload)
+
+
+
+class AsyncCrudCourse:
+    crud = CrudCourse()
+
+    async def readCourseByID(self, db: AsyncSession, id: int):
+        return await db.run_sync(self.crud.readCourseByID, id)
+
+
+    async def readCourseByName(self, db: AsyncSession, name: str):
+        return await db.run_sync(self.crud.readCourseByName, name)
+
+
+    async def readCourseIdByName(self, db: AsyncSession, name: str):
+        return await db.run_sync(self.crud.readCourseIdByName, name)
+
+
+    async def readCourses(self, db: AsyncSession):
+        return await db.run_sync(self.crud.readCourses)
+
+
+    async def readCourseRows(self, db: AsyncSession):
+        return await db.run_sync(self.crud.readCourseRows)
+
+
+    async def createCourse(self, db: AsyncSession, payload: schema.BaseCourse):
+        return await db.run_sync(self.crud.createCourse, payload)
+
+
+    async def deleteCourse(self, db: AsyncSession, payload: Courses):
+        return await db.run_sync(self.crud.deleteCourse, payload)
+
+
+class AsyncCrudCategory:
+    crud = CrudCategory()
+
+    async def readCategoryByID(self, db: AsyncSession, id: int):
+        return await db.run_sync(self.crud.readCategoryByID, id)
+
+
+    async def readCategoryByName(self, db: AsyncSession, name: str):
+        return await db.run_sync(self.crud.readCategoryByName, name)
+
+
+    async def readCategoryIdByName(self, db: AsyncSession, name: str):
+        return await db.run_sync(self.crud.readCategoryIdByName, name)
+
+
+    async def readCoursesByCategory(self, db: AsyncSession, id: int):
+        return await db.run_sync(self.crud.readCoursesByCategory, id)
+
+
+    async def readCategories(self, db: AsyncSession):
+        return await db.run_sync(self.crud.readCategories)
+
+
+    async def readCategoryRows(self, db: AsyncSession):
+        return await db.run_sync(self.crud.readCategoryRows)
+
+
+    async def createCategory(self, db: AsyncSession, payload: schema.Category):
+        return await db.run_sync(self.crud.createCategory, payload)
+
+
+    async def deleteCategory(self, db: AsyncSession, payload: Categories):
+        return await db.run_sync(self.crud.deleteCategory, payload)
+
+
+class AsyncCrudUser:
+    crud = CrudUser()
+
+    async def readUserByID(self, db: AsyncSession, id: int):
+        return await db.run_sync(self.crud.readUserByID, id)
+
+
+    async def readUserByName(self, db: AsyncSession, email: str):
+        return await db.run_sync(self.crud.readUserByName, email)
+
+
+    async def readUserIdByName(self, db: AsyncSession, email: str):
+        return await db.run_sync(self.crud.readUserIdByName, email)
+
+
+    async def readUsers(self, db: AsyncSession):
+        return await db.run_sync(self.crud.readUsers)
+
+
+    async def readUserRows(self, db: AsyncSession):
+        return await db.run_sync(self.crud.readUserRows)
+
+
+    async def createUser(self, db: AsyncSession, payload: schema.User):
+        return await db.run_sync(self.crud.createUser, payload)
+
+
+    async def deleteUser(self, db: AsyncSession, payload: Users):
+        return await db.run_sync(self.crud.deleteUser, payload)
+
+
+
+class AsyncCrudSession:
+    crud = CrudSession()
+
+    async def readActiveSession(self, db: AsyncSession):
+        return await db.run_sync(self.crud.readActiveSession)
+
+
+    async def openSession(self, db: AsyncSession, payload: schema.Session):
+        return await db.run_sync(self.crud.openSession, payload)
+
+
+    async def closeSession(self, db: AsyncSession, payload: Sessions):
+        return await db.run_sync(self.crud.closeSession, payload)
@@ -0,0 +1,25 @@
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from database.db import applyPragmas, resolveSettings
+
+
+def createAsyncEngine(url: str = None, profile: str = None,
+                        poolSize: int = 5, **pragmas):
+    url, pragmas = resolveSettings(url, profile, **pragmas)
+    if url.startswith("sqlite://"):
+        url = url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    # aiosqlite defaults to NullPool, which opens a connection (and a thread)
+    # per session; long-running services keep a few of them open instead
+    engine = create_async_engine(url, poolclass=AsyncAdaptedQueuePool,
+                                    pool_size=poolSize)
+    if engine.dialect.name == "sqlite":
+        applyPragmas(engine.sync_engine, pragmas)
+    return engine
+
+
+asyncEngine = createAsyncEngine()
+AsyncSessionLocal = sessionmaker(asyncEngine, class_=AsyncSession,
+                                    autocommit=False, autoflush=False,
+                                    expire_on_commit=False)
@@ -0,0 +1,135 @@
+import os
+from datetime import datetime
+
+from sqlalchemy import Column, Index, MetaData, Table
+from sqlalchemy import delete, func, insert, select, union_all
+from sqlalchemy.orm import Session
+
+from database.models import ArchiveCatalog, StudySession
+
+# Study sessions older than a cutoff can be moved out of the main file into
+# one SQLite file per year, listed in the archive table. Rollups stay in the
+# main file, so reports built on them never open an archive. Readers ask
+# sessionTables() for the tables covering a time range: the main one plus
+# only the archives overlapping it, ATTACHed to the connection on first use.
+#
+# With WAL a transaction spanning attached files is atomic per file only. A
+# move copies with INSERT OR IGNORE before deleting from the main file, so
+# running archive again after an interruption completes it. Nothing is
+# deleted unless every row is in the archive as it is in the main file.
+
+archiveMetadata = MetaData()
+
+
+def archiveDir(db: Session):
+    directory = os.environ.get("STUDY_ARCHIVE_DIR")
+    if directory:
+        return directory
+    database = db.get_bind().url.database or ""
+    return os.path.join(os.path.dirname(database) or ".", "archive")
+
+
+def schemaName(year: int):
+    return f"archive_{year}"
+
+
+def archiveTable(year: int):
+    schema = schemaName(year)
+    key = f"{schema}.studysession"
+    if key in archiveMetadata.tables:
+        return archiveMetadata.tables[key]
+    columns = [Column(column.name, column.type, primary_key=column.primary_key)
+                for column in StudySession.__table__.columns]
+    return Table("studysession", archiveMetadata, *columns,
+                    Index("ix_studysession_subscription_id_start_session",
+                            "subscription_id", "start_session"),
+                    schema=schema)
+
+
+def attach(db: Session, entry: ArchiveCatalog, create: bool = False):
+    # ATTACH lasts as long as the DBAPI connection, so the attached years are
+    # remembered in the pooled connection's info
+    connection = db.connection()
+    attached = connection.info.setdefault("attachedArchives", set())
+    table = archiveTable(entry.year)
+    if entry.year not in attached:
+        connection.exec_driver_sql(
+            f"ATTACH DATABASE ? AS {schemaName(entry.year)}", (entry.path,))
+        attached.add(entry.year)
+    if create:
+        table.create(connection, checkfirst=True)
+    return table
+
+
+def readCatalog(db: Session):
+    return db.query(ArchiveCatalog).order_by(ArchiveCatalog.year).all()
+
+
+def sessionTables(db: Session, since: datetime = None, until: datetime = None):
+    tables = [StudySession.__table__]
+    for entry in readCatalog(db):
+        if until and entry.first_start >= until:
+            continue
+        if since and entry.last_start < since:
+            continue
+        tables.append(attach(db, entry))
+    return tables
+
+
+def unionSessions(tables: list):
+    """A selectable shaped like studysession over all ``tables``.
+
+    SQLite pushes filters on it down into every branch of the UNION ALL, so
+    each file is still searched through its own indexes.
+    """
+    if len(tables) == 1:
+        return tables[0]
+    return union_all(*(select(table) for table in tables)).\
+        subquery("studysession")
+
+
+def archiveSessions(db: Session, before: datetime, directory: str = None):
+    """Move the sessions started before ``before`` into their year's archive.
+
+    Returns (year, moved) pairs. Raises ValueError, leaving the rows in
+    place, when an archive already holds a different row under one of
+    their ids.
+    """
+    table = StudySession.__table__
+    directory = directory or archiveDir(db)
+    years = db.execute(select(func.strftime("%Y", table.c.start_session)).
+        where(table.c.start_session < before).distinct()).scalars().all()
+    moved = []
+    for year in sorted(int(year) for year in years):
+        entry = db.get(ArchiveCatalog, year)
+        if entry is None:
+            os.makedirs(directory, exist_ok=True)
+            entry = ArchiveCatalog(year=year, rows=0, path=os.path.join(
+                directory, f"studysession_{year}.db"))
+            db.add(entry)
+        target = attach(db, entry, create=True)
+        inRange = (table.c.start_session >= datetime(year, 1, 1),
+                    table.c.start_session < min(datetime(year + 1, 1, 1),
+                                                before))
+        db.execute(insert(target).prefix_with("OR IGNORE").from_select(
+            [column.name for column in table.columns],
+            select(table).where(*inRange)))
+        # rows skipped by OR IGNORE must be copies left by an interrupted
+        # run; an archived row under the same id means the id was reused
+        # (aliased: unqualified, both tables are named studysession)
+        archived = target.alias("archived")
+        conflicts = db.execute(select(func.count(table.c.id)).where(
+            *inRange, ~select(archived.c.id).where(
+                *(archived.c[column.name].is_(column)
+                    for column in table.columns)).exists())).scalar()
+        if conflicts:
+            raise ValueError(f"{conflicts} study sessions of {year} have the "
+                                f"id of a different archived session")
+        count = db.execute(delete(table).where(*inRange)).rowcount
+        entry.first_start, entry.last_start, entry.rows = db.execute(
+            select(func.min(target.c.start_session),
+                    func.max(target.c.start_session),
+                    func.count(target.c.id))).one()
+        db.flush()
+        moved.append((year, count))
+    return moved
@@ -0,0 +1,149 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+
+from database.models import Categories, Courses, LookupVersion, Users
+
+
+class LookupCache:
+    """Name to id cache for courses, categories and users.
+
+    Entries are kept in process as an LRU and, when ``path`` is set, in a
+    JSON file shared between runs. Both are tied to the version stored in
+    the lookupversion table, which every create/delete of a cached kind
+    bumps in its own transaction; the version is read once per session.
+
+    Ids found by a session stay pending until it commits, so nothing read
+    inside a transaction that is rolled back is ever cached, and a session
+    that bumped the version caches nothing.
+    """
+
+    def __init__(self, maxsize: int = 1024, path: str = None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.version = None
+
+
+    def validate(self, db: Session):
+        if db.info.get("lookupCacheValidated"):
+            return
+        version = db.execute(select(LookupVersion.version).\
+            where(LookupVersion.id==1)).scalar()
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+            self.load()
+        db.info["lookupCacheValidated"] = True
+
+
+    def get(self, db: Session, kind: str, name: str):
+        self.validate(db)
+        key = (kind, name.upper())
+        id = db.info.get("lookupPending", {}).get(key)
+        if id is not None:
+            return id
+        id = self.entries.get(key)
+        if id is not None:
+            self.entries.move_to_end(key)
+        return id
+
+
+    def put(self, db: Session, kind: str, name: str, id: int):
+        if db.info.get("lookupInvalidated"):
+            return
+        db.info.setdefault("lookupPending", {})[(kind, name.upper())] = id
+        db.info["lookupPendingVersion"] = self.version
+
+
+    def invalidate(self, db: Session):
+        # a time based version is never handed out twice, even when the
+        # transaction bumping it is rolled back
+        db.execute(update(LookupVersion).where(LookupVersion.id==1).\
+            values(version=func.max(LookupVersion.version + 1,
+                                    time.time_ns())))
+        self.entries.clear()
+        self.version = None
+        db.info["lookupInvalidated"] = True
+        db.info.pop("lookupPending", None)
+        db.info.pop("lookupCacheValidated", None)
+
+
+    def publish(self, db: Session):
+        pending = db.info.pop("lookupPending", None)
+        version = db.info.pop("lookupPendingVersion", None)
+        if db.info.pop("lookupInvalidated", None):
+            self.entries.clear()
+            self.version = None
+        elif pending and version is not None and version == self.version:
+            for key, id in pending.items():
+                self.entries[key] = id
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            self.save()
+        db.info.pop("lookupCacheValidated", None)
+
+
+    def discard(self, db: Session):
+        db.info.pop("lookupPending", None)
+        db.info.pop("lookupPendingVersion", None)
+        if db.info.pop("lookupInvalidated", None):
+            self.entries.clear()
+            self.version = None
+        db.info.pop("lookupCacheValidated", None)
+
+
+    def warm(self, db: Session):
+        self.validate(db)
+        for kind, column in [("course", Courses.name),
+                                ("category", Categories.name),
+                                ("user", Users.email)]:
+            for name, id in db.query(column, column.class_.id).\
+                    limit(self.maxsize):
+                self.put(db, kind, name, id)
+
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != self.version:
+            return
+        for kind, name, id in data.get("entries", [])[-self.maxsize:]:
+            self.entries[(kind, name)] = id
+
+
+    def save(self):
+        if not self.path or self.version is None:
+            return
+        data = {
+            "version": self.version,
+            "entries": [[kind, name, id]
+                        for (kind, name), id in self.entries.items()],
+        }
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temporary, self.path)
+
+
+lookupCache = LookupCache(path=os.environ.get("STUDY_LOOKUP_CACHE"))
+
+
+@event.listens_for(Session, "after_commit")
+def publishLookups(db):
+    lookupCache.publish(db)
+
+
+@event.listens_for(Session, "after_rollback")
+def discardLookups(db):
+    lookupCache.discard(db)
@@ -1,52 +1,341 @@
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from datetime import datetime, time
+from itertools import islice
+from typing import Iterable
+from sqlalchemy import and_, or_, func, select
+from sqlalchemy.orm import Session, aliased, joinedload, lazyload, selectinload
 
 from database.models import Courses, Categories, Sessions, Users, Subscriptions, StudySession
+from database.models import StudySessionDaily
 from schema import schema
-from database.db import engine, Base
+from database.db import engine
+from database import archive, migrations, rollup
+from database.cache import lookupCache
+from database.retry import retryWrites
 
-Base.metadata.create_all(engine)
+migrations.upgrade(engine)
+
+
+LOADING_STRATEGIES = {
+    "lazy": lazyload,
+    "joined": joinedload,
+    "selectin": selectinload,
+}
+
+
+def loadOptions(strategy: str, *paths):
+    loader = LOADING_STRATEGIES[strategy]
+    options = []
+    for path in paths:
+        option = loader(path[0])
+        for relationship in path[1:]:
+            option = getattr(option, loader.__name__)(relationship)
+        options.append(option)
+    return options
+
+
+def studySessionGraph(entity=StudySession):
+    return (
+        (entity.subscription, Subscriptions.course, Courses.category),
+        (entity.subscription, Subscriptions.user),
+    )
+
+
+SUBSCRIPTION_GRAPH = (
+    (Subscriptions.course, Courses.category),
+    (Subscriptions.user,),
+)
+
+
+# SQLite expressions bucketing a date or datetime column. Weeks are labelled
+# by their Monday and weekdays are numbered from Sunday, as in strftime('%w').
+REPORT_BUCKETS = {
+    "day": lambda moment: func.date(moment),
+    "week": lambda moment: func.date(moment, "weekday 0", "-6 days"),
+    "month": lambda moment: func.strftime("%Y-%m", moment),
+    "weekday": lambda moment: func.strftime("%w", moment),
+    "hour": lambda moment: func.strftime("%H", moment),
+}
+
+
+def isWholeDay(value: datetime):
+    return value is None or value.time() == time()
+
+
+def studySessionEntity(db: Session, since: datetime = None,
+                        until: datetime = None):
+    # StudySession itself, or mapped over the union with the archives that
+    # overlap the range, for ORM reads that must include archived history
+    tables = archive.sessionTables(db, since, until)
+    if len(tables) == 1:
+        return StudySession
+    return aliased(StudySession, archive.unionSessions(tables))
 
 
 class CrudStudy:
 
-    def readStudySessions(self, db: Session, ids: list):
-        return db.query(StudySession).\
-            filter(StudySession.subscription_id.in_(ids)).all()
+    def readReport(self, db: Session, user_id: int, by: str = None,
+                    since: datetime = None, until: datetime = None):
+        # Buckets of whole days come from the daily rollup; hours, and ranges
+        # that start or end within a day, are grouped over studysession, and
+        # the archives overlapping the range, using their
+        # (subscription_id, start_session) index.
+        if by != "hour" and isWholeDay(since) and isWholeDay(until):
+            source = StudySessionDaily.__table__
+            moment = source.c.day
+            seconds = func.sum(source.c.seconds)
+            count = func.sum(source.c.count)
+            since = since and since.date()
+            until = until and until.date()
+        else:
+            source = archive.unionSessions(
+                archive.sessionTables(db, since, until))
+            moment = source.c.start_session
+            seconds = func.sum(source.c.duration_seconds)
+            count = func.count(source.c.id)
+
+        columns = [Courses.name.label("course")]
+        if by:
+            bucket = REPORT_BUCKETS[by](moment).label("bucket")
+            columns.insert(0, bucket)
+        query = db.query(*columns,
+                            seconds.label("total_seconds"),
+                            count.label("session_count")).\
+            select_from(source).\
+            join(Subscriptions, source.c.subscription_id==Subscriptions.id).\
+            join(Courses, Subscriptions.course_id==Courses.id).\
+            filter(Subscriptions.user_id==user_id)
+        if since:
+            query = query.filter(moment >= since)
+        if until:
+            query = query.filter(moment < until)
+        if by:
+            return query.group_by(bucket, Courses.id, Courses.name).\
+                order_by(bucket, Courses.name).all()
+        return query.group_by(Courses.id, Courses.name).\
+            order_by(Courses.name).all()
+
+
+    def readStudySessions(self, db: Session, ids: list,
+                            strategy: str = "lazy"):
+        entity = studySessionEntity(db)
+        return db.query(entity).\
+            options(*loadOptions(strategy, *studySessionGraph(entity))).\
+            filter(entity.subscription_id.in_(ids)).all()
+
+
+    def filterStudySessions(self, ids: list, since: datetime = None,
+                            until: datetime = None, after: tuple = None,
+                            columns=StudySession):
+        # ``columns`` is the model or the .c of a selectable shaped like it
+        filters = [columns.subscription_id.in_(ids)]
+        if since:
+            filters.append(columns.start_session >= since)
+        if until:
+            filters.append(columns.start_session < until)
+        if after:
+            startSession, id = after
+            filters.append(or_(
+                columns.start_session > startSession,
+                and_(columns.start_session == startSession,
+                    columns.id > id)))
+        return filters
+
+
+    def queryStudySessions(self, db: Session, ids: list,
+                            since: datetime = None, until: datetime = None,
+                            after: tuple = None, strategy: str = "lazy"):
+        entity = studySessionEntity(db, since, until)
+        return db.query(entity).\
+            options(*loadOptions(strategy, *studySessionGraph(entity))).\
+            filter(*self.filterStudySessions(ids, since, until, after,
+                                                entity)).\
+            order_by(entity.start_session, entity.id)
+
+
+    def iterStudySessions(self, db: Session, ids: list,
+                            since: datetime = None, until: datetime = None,
+                            strategy: str = "lazy", batchSize: int = 1000):
+        return self.queryStudySessions(db, ids, since, until,
+                                        strategy=strategy).\
+            yield_per(batchSize)
+
+
+    def readStudySessionsPage(self, db: Session, ids: list, limit: int,
+                                since: datetime = None, until: datetime = None,
+                                after: tuple = None, strategy: str = "lazy"):
+        # Keyset pagination on (start_session, id): pass the last row of a
+        # page as ``after`` to read the next one.
+        return self.queryStudySessions(db, ids, since, until, after,
+                                        strategy=strategy).\
+            limit(limit).all()
+
+
+    def selectStudySessionListing(self, ids: list, since: datetime = None,
+                                    until: datetime = None, after: tuple = None,
+                                    tables: list = None):
+        # Only the columns a listing shows, as plain rows: no ORM identity
+        # map, relationship loading or per-row model. ``tables`` are the
+        # studysession tables to read, see archive.sessionTables.
+        source = archive.unionSessions(tables or [StudySession.__table__])
+        return select(
+                source.c.id,
+                Users.email.label("user"),
+                Courses.name.label("course"),
+                source.c.start_session,
+                source.c.end_session).\
+            join(Subscriptions, source.c.subscription_id==Subscriptions.id).\
+            join(Users, Subscriptions.user_id==Users.id).\
+            join(Courses, Subscriptions.course_id==Courses.id).\
+            filter(*self.filterStudySessions(ids, since, until, after,
+                                                source.c)).\
+            order_by(source.c.start_session, source.c.id)
+
+
+    def iterStudySessionRows(self, db: Session, ids: list,
+                                since: datetime = None, until: datetime = None,
+                                after: tuple = None, batchSize: int = 1000):
+        statement = self.selectStudySessionListing(ids, since, until, after,
+                        tables=archive.sessionTables(db, since, until)).\
+            execution_options(yield_per=batchSize)
+        return db.execute(statement)
+
+
+    def readStudySessionRowsPage(self, db: Session, ids: list, limit: int,
+                                    since: datetime = None,
+                                    until: datetime = None, after: tuple = None):
+        statement = self.selectStudySessionListing(ids, since, until, after,
+                        tables=archive.sessionTables(db, since, until)).\
+            limit(limit)
+        return db.execute(statement).all()
 
     
-    def readStudySessionsBySubscriptionId(self, db: Session, id: int):
-        return db.query(StudySession).\
-            filter(StudySession.subscription_id==id).all()
+    def selectStudySessionRows(self, user_id: int, tables: list = None):
+        source = archive.unionSessions(tables or [StudySession.__table__])
+        return select(
+                source.c.id,
+                Users.email.label("user"),
+                Courses.name.label("course"),
+                Categories.name.label("category"),
+                source.c.start_session,
+                source.c.end_session).\
+            join(Subscriptions, source.c.subscription_id==Subscriptions.id).\
+            join(Users, Subscriptions.user_id==Users.id).\
+            join(Courses, Subscriptions.course_id==Courses.id).\
+            join(Categories, Courses.category_id==Categories.id).\
+            filter(Subscriptions.user_id==user_id).\
+            order_by(source.c.id)
+
+
+    def streamStudySessions(self, db: Session, user_id: int,
+                            batchSize: int = 10000):
+        statement = self.selectStudySessionRows(user_id,
+                                                archive.sessionTables(db)).\
+            execution_options(yield_per=batchSize)
+        return db.execute(statement)
+
+
+    def hasStudySessions(self, db: Session, subscription_id: int):
+        source = archive.unionSessions(archive.sessionTables(db))
+        return db.execute(select(source.c.id).\
+            where(source.c.subscription_id==subscription_id).limit(1)).\
+            first() is not None
+
+
+    def archiveStudySessions(self, db: Session, before: datetime,
+                                directory: str = None):
+        return archive.archiveSessions(db, before, directory)
+
+
+    def readArchives(self, db: Session):
+        return archive.readCatalog(db)
+
+
+    def readStudySessionsBySubscriptionId(self, db: Session, id: int,
+                                            strategy: str = "lazy"):
+        entity = studySessionEntity(db)
+        return db.query(entity).\
+            options(*loadOptions(strategy, *studySessionGraph(entity))).\
+            filter(entity.subscription_id==id).all()
 
 
     def readStudySessionById(self, db: Session, id: int):
-        return db.query(StudySession).get(id).all()
+        return db.query(StudySession).get(id)
 
 
+    @retryWrites
     def createStudySession(self, db: Session, payload: schema.StudySession):
         dbStudySession = StudySession(
             subscription_id = payload.subscription_id,
-            start_session = payload.start_session,
-            end_session = payload.end_session
+            **StudySession.columnsFor(payload.start_session,
+                                        payload.end_session)
         )
         db.add(dbStudySession)
-        db.commit()
-
-
+        db.flush()
+        rollup.addSessions(db, [(dbStudySession.subscription_id,
+                                dbStudySession.start_session,
+                                dbStudySession.duration_seconds)])
+
+
+    def bulkCreate(self, db: Session, payloads: Iterable[schema.BaseStudySession],
+                    batchSize: int = 5000):
+        payloads = iter(payloads)
+        count = 0
+        while True:
+            batch = [
+                {
+                    "subscription_id": payload.subscription_id,
+                    **StudySession.columnsFor(payload.start_session,
+                                                payload.end_session),
+                }
+                for payload in islice(payloads, batchSize)
+            ]
+            if not batch:
+                break
+            db.execute(StudySession.__table__.insert(), batch)
+            rollup.addSessions(db, ((row["subscription_id"],
+                                    row["start_session"],
+                                    row["duration_seconds"])
+                                    for row in batch))
+            count += len(batch)
+        return count
+
+
+    @retryWrites
     def deleteStudySession(self, db: Session, payload: StudySession):
         db.delete(payload)
-        db.commit()
+        db.flush()
+        rollup.removeSession(db, payload.subscription_id,
+                                payload.start_session, payload.duration_seconds)
+
+
+    def rebuildDailyRollup(self, db: Session):
+        rollup.rebuild(db, archive.sessionTables(db))
 
 
 
 class CrudSubscription:
     
-    def readSubscriptions(self, db: Session, user_id: int):
+    def readSubscriptions(self, db: Session, user_id: int,
+                            strategy: str = "lazy"):
         return db.query(Subscriptions).\
+            options(*loadOptions(strategy, *SUBSCRIPTION_GRAPH)).\
             filter(Subscriptions.user_id==user_id).all()
 
     
+    def readSubscriptionRows(self, db: Session, user_id: int):
+        return db.execute(select(
+                Users.email.label("user"),
+                Courses.name.label("course"),
+                Categories.name.label("category"),
+                Subscriptions.subscribed_on,
+                Subscriptions.conclusion_on).\
+            join(Users, Subscriptions.user_id==Users.id).\
+            join(Courses, Subscriptions.course_id==Courses.id).\
+            join(Categories, Courses.category_id==Categories.id).\
+            filter(Subscriptions.user_id==user_id).\
+            order_by(Subscriptions.id)).all()
+
+
     def readSubscriptionByUserAndCourse(self, db: Session, user_id: int,
                                 course_id: int):
         return db.query(Subscriptions).\
@@ -59,11 +348,14 @@ class CrudSubscription:
             filter(Subscriptions.course_id==course_id).all()         
 
 
-    def readSubscriptionByUser(self, db: Session, user_id: int):
+    def readSubscriptionByUser(self, db: Session, user_id: int,
+                                strategy: str = "lazy"):
         return db.query(Subscriptions).\
+            options(*loadOptions(strategy, *SUBSCRIPTION_GRAPH)).\
             filter(Subscriptions.user_id==user_id).all()
 
 
+    @retryWrites
     def createSubscription(self, db: Session, payload: schema.BaseSubscription):
         dbSubscription = Subscriptions(
             course_id = payload.course_id,
@@ -72,12 +364,13 @@ class CrudSubscription:
             conclusion_on = payload.conclusion_on
         ) 
         db.add(dbSubscription)
-        db.commit()
+        db.flush()
 
 
+    @retryWrites
     def deleteSubscription(self, db: Session, payload: Subscriptions):
         db.delete(payload)
-        db.commit()
+        db.flush()
 
 
 
@@ -88,26 +381,55 @@ class CrudCourse:
         
 
     def readCourseByName(self, db: Session, name: str):
-        return db.query(Courses).\
+        id = lookupCache.get(db, "course", name)
+        if id is not None:
+            return db.query(Courses).get(id)
+        dbCourse = db.query(Courses).\
             filter(Courses.name==name.upper()).first()
+        if dbCourse:
+            lookupCache.put(db, "course", name, dbCourse.id)
+        return dbCourse
+
+
+    def readCourseIdByName(self, db: Session, name: str):
+        id = lookupCache.get(db, "course", name)
+        if id is None:
+            id = db.query(Courses.id).\
+                filter(Courses.name==name.upper()).scalar()
+            if id is not None:
+                lookupCache.put(db, "course", name, id)
+        return id
 
 
     def readCourses(self, db: Session):
         return db.query(Courses).all()
 
 
+    def readCourseRows(self, db: Session):
+        return db.execute(select(
+                Courses.id,
+                Courses.name,
+                Categories.name.label("category")).\
+            outerjoin(Categories, Courses.category_id==Categories.id).\
+            order_by(Courses.id)).all()
+
+
+    @retryWrites
     def createCourse(self, db: Session, payload: schema.BaseCourse):
         dbCourse = Courses(
             name = payload.name.upper(),
             category_id = payload.category_id,
         )
         db.add(dbCourse)
-        db.commit()
+        db.flush()
+        lookupCache.invalidate(db)
 
 
+    @retryWrites
     def deleteCourse(self, db: Session, payload: Courses):
         db.delete(payload)
-        db.commit()
+        db.flush()
+        lookupCache.invalidate(db)
 
 
 class CrudCategory:
@@ -117,8 +439,24 @@ class CrudCategory:
         
 
     def readCategoryByName(self, db: Session, name: str):
-        return db.query(Categories).\
+        id = lookupCache.get(db, "category", name)
+        if id is not None:
+            return db.query(Categories).get(id)
+        dbCategory = db.query(Categories).\
             filter(Categories.name==name.upper()).first()
+        if dbCategory:
+            lookupCache.put(db, "category", name, dbCategory.id)
+        return dbCategory
+
+
+    def readCategoryIdByName(self, db: Session, name: str):
+        id = lookupCache.get(db, "category", name)
+        if id is None:
+            id = db.query(Categories.id).\
+                filter(Categories.name==name.upper()).scalar()
+            if id is not None:
+                lookupCache.put(db, "category", name, id)
+        return id
 
 
     def readCoursesByCategory(self, db:Session, id: int):
@@ -130,17 +468,26 @@ class CrudCategory:
         return db.query(Categories).all()
 
 
+    def readCategoryRows(self, db: Session):
+        return db.execute(select(Categories.id, Categories.name).\
+            order_by(Categories.id)).all()
+
+
+    @retryWrites
     def createCategory(self, db: Session, payload: schema.Category):
         dbCategory = Categories(
             name = payload.name.upper()
         )
         db.add(dbCategory)
-        db.commit()
+        db.flush()
+        lookupCache.invalidate(db)
 
 
+    @retryWrites
     def deleteCategory(self, db: Session, payload: Categories):
         db.delete(payload)
-        db.commit()
+        db.flush()
+        lookupCache.invalidate(db)
 
 
 class CrudUser:
@@ -150,25 +497,50 @@ class CrudUser:
 
     
     def readUserByName(self, db: Session, email: str):
-        return db.query(Users).\
+        id = lookupCache.get(db, "user", email)
+        if id is not None:
+            return db.query(Users).get(id)
+        dbUser = db.query(Users).\
             filter(Users.email==email.upper()).first()
+        if dbUser:
+            lookupCache.put(db, "user", email, dbUser.id)
+        return dbUser
+
+
+    def readUserIdByName(self, db: Session, email: str):
+        id = lookupCache.get(db, "user", email)
+        if id is None:
+            id = db.query(Users.id).\
+                filter(Users.email==email.upper()).scalar()
+            if id is not None:
+                lookupCache.put(db, "user", email, id)
+        return id
 
 
     def readUsers(self, db: Session):
         return db.query(Users).all()
 
 
+    def readUserRows(self, db: Session):
+        return db.execute(select(Users.id, Users.email).\
+            order_by(Users.id)).all()
+
+
+    @retryWrites
     def createUser(self, db: Session, payload: schema.User):
         dbUser = Users(
             email = payload.email.upper()
         )
         db.add(dbUser)
-        db.commit()
+        db.flush()
+        lookupCache.invalidate(db)
 
 
+    @retryWrites
     def deleteUser(self, db: Session, payload: Users):
         db.delete(payload)
-        db.commit()
+        db.flush()
+        lookupCache.invalidate(db)
 
 
 
@@ -179,6 +551,7 @@ class CrudSession:
             filter(Sessions.is_active==True).first()
 
 
+    @retryWrites
     def openSession(self, db: Session, payload: schema.Session):
         dbSession = Sessions(
             user_id = payload.user_id,
@@ -186,9 +559,10 @@ class CrudSession:
             is_active = True
         )
         db.add(dbSession)
-        db.commit()
+        db.flush()
     
 
+    @retryWrites
     def closeSession(self, db: Session, payload: Sessions):
         payload.is_active = False
-        db.commit()
\ No newline at end of file
+        db.flush()
\ No newline at end of file
@@ -1,9 +1,91 @@
-from sqlalchemy import create_engine
+import os
+from configparser import ConfigParser
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./database/sqlite.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL,
-                        connect_args={"check_same_thread": False})
+DEFAULT_PROFILE = "durable"
+CONFIG_FILE = os.environ.get("STUDY_CONFIG", "study.ini")
+
+# Pragmas applied to every new SQLite connection. busy_timeout goes first so
+# the remaining pragmas wait for a lock instead of failing.
+PROFILES = {
+    "durable": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16000,
+    },
+    "fast": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    "readonly-report": {
+        "busy_timeout": 5000,
+        "query_only": "ON",
+        "cache_size": -128000,
+        "mmap_size": 1073741824,
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def loadConfig(path: str = CONFIG_FILE):
+    """Return the database url, profile and pragma overrides.
+
+    Values come from the STUDY_DATABASE_URL and STUDY_DB_PROFILE environment
+    variables, then from the [database] section of the config file, whose
+    other keys are read as pragmas.
+    """
+    parser = ConfigParser()
+    parser.read(path)
+    section = dict(parser["database"]) if parser.has_section("database") else {}
+    url = os.environ.get("STUDY_DATABASE_URL") or \
+        section.pop("url", SQLALCHEMY_DATABASE_URL)
+    profile = os.environ.get("STUDY_DB_PROFILE") or \
+        section.pop("profile", DEFAULT_PROFILE)
+    section.pop("url", None)
+    section.pop("profile", None)
+    return url, profile, section
+
+
+def applyPragmas(engine, pragmas: dict):
+    @event.listens_for(engine, "connect")
+    def setPragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+        # the driver opens a transaction right before the first write; make it
+        # BEGIN IMMEDIATE so the write lock is taken there, under busy_timeout,
+        # rather than upgraded from a read lock partway through
+        dbapi_connection.isolation_level = "IMMEDIATE"
+
+
+def resolveSettings(url: str = None, profile: str = None, **pragmas):
+    configUrl, configProfile, configPragmas = loadConfig()
+    url = url or configUrl
+    profile = profile or configProfile
+    if profile not in PROFILES:
+        raise ValueError(f"unknown database profile {profile!r}, "
+                            f"expected one of {', '.join(PROFILES)}")
+    return url, {**PROFILES[profile], **configPragmas, **pragmas}
+
+
+def createEngine(url: str = None, profile: str = None, **pragmas):
+    url, pragmas = resolveSettings(url, profile, **pragmas)
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    if engine.dialect.name == "sqlite":
+        applyPragmas(engine, pragmas)
+    return engine
+
+
+engine = createEngine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
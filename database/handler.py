@@ -1,6 +1,11 @@
 from database.db import SessionLocal
 
 class DbHandler:
+    def __init__(self, commitOn: tuple = ()):
+        # exceptions that still end the unit of work successfully, such as
+        # click's Exit raised by ctx.exit()
+        self.commitOn = commitOn
+
     def __enter__(self):
         # logger.debug("opening connection to database")
         self.db = SessionLocal()
@@ -8,5 +13,29 @@ class DbHandler:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         # logger.debug("closing connection to database")
-        # self.db.commit()
-        self.db.close()
+        try:
+            if exc_type is None or issubclass(exc_type, self.commitOn):
+                self.db.commit()
+            else:
+                self.db.rollback()
+        finally:
+            self.db.close()
+
+
+class AsyncDbHandler:
+    def __init__(self, commitOn: tuple = ()):
+        self.commitOn = commitOn
+
+    async def __aenter__(self):
+        from database.aiodb import AsyncSessionLocal
+        self.db = AsyncSessionLocal()
+        return self.db
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None or issubclass(exc_type, self.commitOn):
+                await self.db.commit()
+            else:
+                await self.db.rollback()
+        finally:
+            await self.db.close()
@@ -0,0 +1,151 @@
+import os
+import sqlite3
+from contextlib import closing
+
+from sqlalchemy import bindparam, func, inspect, select, text, update
+
+from database.db import engine, Base
+from database import rollup
+import database.models
+
+
+def createIndexes(connection):
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=connection)
+
+
+def createSchema(connection):
+    Base.metadata.create_all(connection)
+    createIndexes(connection)
+    connection.execute(text("ANALYZE"))
+
+
+def createDailyRollup(connection):
+    # filled by addDurationColumns, which needs the stored durations
+    database.models.StudySessionDaily.__table__.create(connection,
+                                                        checkfirst=True)
+
+
+def addDurationColumns(connection, batchSize: int = 10000):
+    StudySession = database.models.StudySession
+    existing = {column["name"]
+                for column in inspect(connection).get_columns("studysession")}
+    for column in ["start_epoch", "end_epoch", "duration_seconds"]:
+        if column not in existing:
+            connection.exec_driver_sql(
+                f"ALTER TABLE studysession ADD COLUMN {column} INTEGER")
+
+    table = StudySession.__table__
+    lastID = 0
+    while True:
+        rows = connection.execute(
+            select(table.c.id, table.c.start_session, table.c.end_session).
+                where(table.c.id > lastID,
+                        table.c.duration_seconds.is_(None),
+                        table.c.start_session.isnot(None),
+                        table.c.end_session.isnot(None)).
+                order_by(table.c.id).limit(batchSize)).all()
+        if not rows:
+            break
+        connection.execute(
+            update(table).where(table.c.id == bindparam("row_id")),
+            [{"row_id": row.id,
+                **StudySession.columnsFor(row.start_session, row.end_session)}
+                for row in rows])
+        lastID = rows[-1].id
+    rollup.rebuild(connection)
+
+
+def createLookupVersion(connection):
+    database.models.LookupVersion.__table__.create(connection, checkfirst=True)
+    connection.exec_driver_sql(
+        "INSERT OR IGNORE INTO lookupversion (id, version) VALUES (1, 0)")
+
+
+def createArchiveCatalog(connection):
+    database.models.ArchiveCatalog.__table__.create(connection, checkfirst=True)
+
+
+def archivedMaxID(connection):
+    # archive files are read with their own connection: ATTACH is not allowed
+    # inside the migration's transaction
+    highest = 0
+    for path in connection.execute(
+            select(database.models.ArchiveCatalog.path)).scalars():
+        if not os.path.exists(path):
+            continue
+        url = f"file:{path}?mode=ro"
+        with closing(sqlite3.connect(url, uri=True)) as archive:
+            highest = max(highest, archive.execute(
+                "SELECT coalesce(max(id), 0) FROM studysession").fetchone()[0])
+    return highest
+
+
+def addStudySessionAutoincrement(connection):
+    # SQLite can only add AUTOINCREMENT by rebuilding the table
+    StudySession = database.models.StudySession
+    created = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' "
+        "AND name = 'studysession'")).scalar()
+    if "AUTOINCREMENT" not in created.upper():
+        for index in inspect(connection).get_indexes("studysession"):
+            connection.exec_driver_sql(f"DROP INDEX {index['name']}")
+        connection.exec_driver_sql(
+            "ALTER TABLE studysession RENAME TO studysession_old")
+        StudySession.__table__.create(connection)
+        columns = ", ".join(column.name
+                            for column in StudySession.__table__.columns)
+        connection.exec_driver_sql(
+            f"INSERT INTO studysession ({columns}) "
+            f"SELECT {columns} FROM studysession_old")
+        connection.exec_driver_sql("DROP TABLE studysession_old")
+        connection.exec_driver_sql("ANALYZE studysession")
+    # ids given out before this step may live on in the archives only
+    highest = max(archivedMaxID(connection), connection.execute(
+        select(func.coalesce(func.max(StudySession.id), 0))).scalar())
+    connection.exec_driver_sql(
+        "DELETE FROM sqlite_sequence WHERE name = 'studysession'")
+    connection.exec_driver_sql(
+        "INSERT INTO sqlite_sequence (name, seq) VALUES ('studysession', ?)",
+        (highest,))
+
+
+# Each step brings the database from version N to N + 1; the current
+# version is kept in SQLite's user_version so startup only reads a pragma.
+MIGRATIONS = [
+    createSchema,
+    createDailyRollup,
+    addDurationColumns,
+    createLookupVersion,
+    createArchiveCatalog,
+    addStudySessionAutoincrement,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def readVersion(connection):
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def upgrade(bind=engine):
+    with bind.connect() as connection:
+        version = readVersion(connection)
+    if version >= SCHEMA_VERSION:
+        return
+    with bind.begin() as connection:
+        # take the write lock before reading the version again, so processes
+        # starting together on an old database migrate it one at a time
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        version = readVersion(connection)
+        for migration in MIGRATIONS[version:]:
+            migration(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -1,11 +1,28 @@
-# from datetime import datetime
+import calendar
+from datetime import datetime
 from sqlalchemy import Column, ForeignKey, Integer, String, Date, Boolean, DateTime
+from sqlalchemy import Index, text
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from database.db import Base
 
 
+def toEpoch(value: datetime) -> int:
+    # naive datetimes are stored as wall-clock time, so they are converted as
+    # if they were UTC, the same way SQLite's strftime('%s', ...) does
+    return calendar.timegm(value.timetuple())
+
+
+def durationSeconds(startSession: datetime, endSession: datetime) -> int:
+    return int(round((endSession - startSession).total_seconds()))
+
+
 class Sessions(Base):
     __tablename__ = "session"
+    __table_args__ = (
+        Index("ix_session_is_active", "is_active",
+                sqlite_where=text("is_active = 1")),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True) 
     user_id = Column(Integer, ForeignKey("user.id"))
     opened_on = Column(DateTime)
@@ -15,21 +32,49 @@ class Sessions(Base):
 
 class StudySession(Base):
     __tablename__ = "studysession"
+    __table_args__ = (
+        Index("ix_studysession_subscription_id_start_session",
+                "subscription_id", "start_session"),
+        # ids are never handed out twice, even after the newest rows were
+        # deleted or archived: archives and snapshots key rows by id
+        {"sqlite_autoincrement": True},
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     subscription_id = Column(ForeignKey('subscription.id'))
     start_session = Column(DateTime)
     end_session = Column(DateTime)
+    start_epoch = Column(Integer)
+    end_epoch = Column(Integer)
+    duration_seconds = Column(Integer)
     subscription = relationship("Subscriptions", back_populates="study_sessions") 
 
-    @property
+    @hybrid_property
     def time_session(self):
         return self.end_session - self.start_session
 
+    @time_session.expression
+    def time_session(cls):
+        # in SQL the duration is the stored number of seconds
+        return cls.duration_seconds
+
+    @classmethod
+    def columnsFor(cls, startSession: datetime, endSession: datetime):
+        return {
+            "start_session": startSession,
+            "end_session": endSession,
+            "start_epoch": toEpoch(startSession),
+            "end_epoch": toEpoch(endSession),
+            "duration_seconds": durationSeconds(startSession, endSession),
+        }
+
 
 class Subscriptions(Base):
     __tablename__ = "subscription"
+    __table_args__ = (
+        Index("ix_subscription_user_id_course_id", "user_id", "course_id"),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    course_id = Column(ForeignKey('course.id'))
+    course_id = Column(ForeignKey('course.id'), index=True)
     user_id = Column(ForeignKey('user.id'))
     subscribed_on = Column(Date)
     conclusion_on = Column(Date)
@@ -41,8 +86,8 @@ class Subscriptions(Base):
 class Courses(Base):
     __tablename__ = "course"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    name = Column(String)
-    category_id = Column(Integer, ForeignKey("category.id"))
+    name = Column(String, index=True)
+    category_id = Column(Integer, ForeignKey("category.id"), index=True)
     category = relationship("Categories", back_populates="courses")
     users = relationship("Subscriptions", back_populates="course")
 
@@ -50,13 +95,35 @@ class Courses(Base):
 class Categories(Base):
     __tablename__ = "category"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    name = Column(String)
+    name = Column(String, index=True)
     courses = relationship("Courses", back_populates="category")
 
 
 class Users(Base):
     __tablename__ = "user"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    email = Column(String)
+    email = Column(String, index=True)
     courses = relationship("Subscriptions", back_populates="user")
-    sessions = relationship("Sessions", back_populates="user")
\ No newline at end of file
+    sessions = relationship("Sessions", back_populates="user")
+
+class StudySessionDaily(Base):
+    __tablename__ = "studysession_daily"
+    subscription_id = Column(ForeignKey('subscription.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    seconds = Column(Integer, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class LookupVersion(Base):
+    __tablename__ = "lookupversion"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class ArchiveCatalog(Base):
+    __tablename__ = "archive"
+    year = Column(Integer, primary_key=True, autoincrement=False)
+    path = Column(String, nullable=False)
+    first_start = Column(DateTime)
+    last_start = Column(DateTime)
+    rows = Column(Integer, nullable=False, default=0)
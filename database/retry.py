@@ -0,0 +1,81 @@
+import asyncio
+import functools
+import random
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+
+# Writers wait busy_timeout for the write lock before SQLite gives up with
+# "database is locked". Crud writes then retry a few more times with a
+# growing, jittered delay, so writers that collided spread out instead of
+# trying again in step.
+#
+# A retry rolls the transaction back and starts the write over, which is only
+# safe when it is the first write of the transaction: anything written before
+# it would be lost. Every write marks the session's info, and commit or
+# rollback clears the mark; a locked error on a marked session is raised.
+#
+# The async Crud classes call these same methods through run_sync, inside
+# SQLAlchemy's greenlet: there the delay is awaited, leaving the event loop
+# free while the write waits.
+
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.05
+RETRY_MAX_DELAY = 1.0
+
+
+def isLocked(error: OperationalError):
+    return "database is locked" in str(error.orig)
+
+
+def backoff(attempt: int, base: float = RETRY_BASE_DELAY,
+            cap: float = RETRY_MAX_DELAY):
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1)
+
+
+def pause(db: Session, seconds: float):
+    if db.get_bind().dialect.is_async:
+        await_only(asyncio.sleep(seconds))
+    else:
+        time.sleep(seconds)
+
+
+@event.listens_for(Session, "after_flush")
+def markFlush(db, flushContext):
+    db.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def markExecute(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def clearMark(db):
+    db.info.pop("wrote", None)
+
+
+def retryWrites(method):
+    """Retry a Crud write ``method(self, db, ...)`` while the database is
+    locked. Retries taken are counted in ``db.info["lockRetries"]``."""
+    @functools.wraps(method)
+    def wrapper(self, db: Session, *args, **kwargs):
+        attempt = 0
+        while True:
+            first = not db.info.get("wrote")
+            try:
+                return method(self, db, *args, **kwargs)
+            except OperationalError as error:
+                if not (first and isLocked(error)) or \
+                        attempt + 1 >= RETRY_ATTEMPTS:
+                    raise
+                db.rollback()
+                pause(db, backoff(attempt))
+                attempt += 1
+                db.info["lockRetries"] = db.info.get("lockRetries", 0) + 1
+    return wrapper
@@ -0,0 +1,63 @@
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqliteInsert
+
+from database.archive import unionSessions
+from database.models import StudySession, StudySessionDaily
+
+# studysession_daily keeps, per subscription and day, the total seconds and
+# number of study sessions started that day. It is updated in the same
+# transaction as the sessions themselves.
+
+
+def addSessions(bind, sessions):
+    # sessions are (subscription_id, start_session, duration_seconds) tuples
+    totals = defaultdict(lambda: [0, 0])
+    for subscriptionID, startSession, seconds in sessions:
+        total = totals[(subscriptionID, startSession.date())]
+        total[0] += seconds
+        total[1] += 1
+    if not totals:
+        return
+    statement = sqliteInsert(StudySessionDaily)
+    statement = statement.on_conflict_do_update(
+        index_elements=[StudySessionDaily.subscription_id, StudySessionDaily.day],
+        set_={
+            "seconds": StudySessionDaily.seconds + statement.excluded.seconds,
+            "count": StudySessionDaily.count + statement.excluded.count,
+        })
+    bind.execute(statement, [
+        {"subscription_id": subscriptionID, "day": day,
+            "seconds": seconds, "count": count}
+        for (subscriptionID, day), (seconds, count) in totals.items()
+    ])
+
+
+def dayKey(subscriptionID: int, day):
+    return (StudySessionDaily.subscription_id == subscriptionID,
+            StudySessionDaily.day == day)
+
+
+def removeSession(bind, subscriptionID: int, startSession: datetime,
+                    seconds: int):
+    key = dayKey(subscriptionID, startSession.date())
+    bind.execute(update(StudySessionDaily).where(*key).values(
+        seconds=StudySessionDaily.seconds - seconds,
+        count=StudySessionDaily.count - 1))
+    bind.execute(delete(StudySessionDaily).where(
+        *key, StudySessionDaily.count <= 0))
+
+
+def rebuild(bind, tables: list = None):
+    # ``tables`` are the studysession tables to sum, archives included
+    source = unionSessions(tables or [StudySession.__table__])
+    day = func.date(source.c.start_session)
+    bind.execute(delete(StudySessionDaily))
+    bind.execute(insert(StudySessionDaily).from_select(
+        ["subscription_id", "day", "seconds", "count"],
+        select(source.c.subscription_id, day,
+                func.sum(source.c.duration_seconds), func.count(source.c.id)).
+            where(source.c.subscription_id.isnot(None)).
+            group_by(source.c.subscription_id, day)))
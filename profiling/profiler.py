@@ -0,0 +1,177 @@
+import heapq
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+from sqlalchemy import event
+
+PHASES = ["fetch", "serialize", "frame", "render"]
+
+
+class QueryStats:
+    """Count and time the statements executed on an engine."""
+
+    def __init__(self, slowest: int = 5):
+        self.slowest = slowest
+        self.engine = None
+        self.reset()
+
+
+    def reset(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []
+
+
+    def install(self, engine):
+        self.engine = engine
+        event.listen(engine, "before_cursor_execute", self.before)
+        event.listen(engine, "after_cursor_execute", self.after)
+        return self
+
+
+    def remove(self):
+        if self.engine is not None:
+            event.remove(self.engine, "before_cursor_execute", self.before)
+            event.remove(self.engine, "after_cursor_execute", self.after)
+            self.engine = None
+
+
+    def before(self, conn, cursor, statement, parameters, context,
+                executemany):
+        conn.info.setdefault("queryStart", []).append(time.perf_counter())
+        self.count += 1
+
+
+    def after(self, conn, cursor, statement, parameters, context,
+                executemany):
+        elapsed = time.perf_counter() - conn.info["queryStart"].pop()
+        self.seconds += elapsed
+        entry = (elapsed, self.count, " ".join(statement.split()))
+        if len(self.statements) < self.slowest:
+            heapq.heappush(self.statements, entry)
+        else:
+            heapq.heappushpop(self.statements, entry)
+
+
+    def slowestStatements(self):
+        return [(seconds, statement)
+                for seconds, _, statement in sorted(self.statements,
+                                                    reverse=True)]
+
+
+class Profiler:
+    """Time the phases of a command and the SQL it runs.
+
+    Phases nest and are timed exclusively: while an inner phase runs, the
+    outer one is paused, so fetching rows lazily from inside the render loop
+    is still counted as fetch. Time outside any phase is reported as other.
+    """
+
+    def __init__(self, engine, slowest: int = 5, profileFile: str = None):
+        self.queries = QueryStats(slowest).install(engine)
+        self.profileFile = profileFile
+        self.phases = defaultdict(float)
+        self.stack = []
+        self.cProfile = None
+        self.started = self.mark = time.perf_counter()
+        if profileFile:
+            import cProfile
+            self.cProfile = cProfile.Profile()
+            self.cProfile.enable()
+
+
+    def enter(self, name: str):
+        now = time.perf_counter()
+        if self.stack:
+            self.phases[self.stack[-1]] += now - self.mark
+        self.stack.append(name)
+        self.mark = now
+
+
+    def leave(self):
+        now = time.perf_counter()
+        self.phases[self.stack.pop()] += now - self.mark
+        self.mark = now
+
+
+    def stop(self):
+        if self.cProfile:
+            self.cProfile.disable()
+            self.cProfile.dump_stats(self.profileFile)
+        self.queries.remove()
+        self.total = time.perf_counter() - self.started
+
+
+    def report(self):
+        from render.table import renderTable
+
+        names = PHASES + sorted(set(self.phases) - set(PHASES))
+        other = self.total - sum(self.phases.values())
+        rows = [(name, f"{self.phases[name] * 1000:.2f}",
+                    f"{self.phases[name] / self.total * 100:.1f}")
+                for name in names if name in self.phases]
+        rows.append(("other", f"{other * 1000:.2f}",
+                        f"{other / self.total * 100:.1f}"))
+        yield f"Profile: {self.total * 1000:.2f} ms"
+        yield from renderTable(["Phase", "ms", "%"], rows,
+                                aligns=["left", "right", "right"])
+        yield (f"SQL: {self.queries.count} statements, "
+                f"{self.queries.seconds * 1000:.2f} ms")
+        for seconds, statement in self.queries.slowestStatements():
+            yield f"  {seconds * 1000:8.2f} ms  {statement[:100]}"
+        if self.profileFile:
+            yield f"cProfile stats written to {self.profileFile}"
+
+
+activeProfiler = None
+
+
+def start(engine, profileFile: str = None):
+    global activeProfiler
+    activeProfiler = Profiler(engine, profileFile=profileFile)
+    return activeProfiler
+
+
+def stop():
+    global activeProfiler
+    profiler, activeProfiler = activeProfiler, None
+    if profiler:
+        profiler.stop()
+    return profiler
+
+
+@contextmanager
+def timedPhase(profiler, name: str):
+    profiler.enter(name)
+    try:
+        yield
+    finally:
+        profiler.leave()
+
+
+def phase(name: str):
+    # a no-op unless --profile is on
+    if activeProfiler is None:
+        return nullcontext()
+    return timedPhase(activeProfiler, name)
+
+
+def timed(name: str, iterable):
+    # time spent producing each item of a lazy iterable, such as a query
+    # streamed with yield_per
+    if activeProfiler is None:
+        return iterable
+    return timedIter(activeProfiler, name, iter(iterable))
+
+
+def timedIter(profiler, name, iterator):
+    while True:
+        profiler.enter(name)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            profiler.leave()
+        yield item
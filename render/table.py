@@ -0,0 +1,53 @@
+from typing import Callable, Iterable, Optional, Sequence, Union
+
+Rows = Union[Iterable[Sequence], Callable[[], Iterable[Sequence]]]
+
+
+def formatCell(value) -> str:
+    if value is None:
+        return ""
+    return str(value)
+
+
+def measureWidths(headers: Sequence[str], rows: Iterable[Sequence]) -> list:
+    widths = [len(header) for header in headers]
+    for row in rows:
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], len(formatCell(value)))
+    return widths
+
+
+def formatLine(cells: Sequence[str], widths: Sequence[int],
+                aligns: Sequence[str]) -> str:
+    return "  ".join(
+        cell.rjust(width) if align == "right" else cell.ljust(width)
+        for cell, width, align in zip(cells, widths, aligns)
+    ).rstrip()
+
+
+def renderTable(headers: Sequence[str], rows: Rows,
+                widths: Optional[Sequence[int]] = None,
+                aligns: Optional[Sequence[str]] = None):
+    """Yield the lines of a table in tabulate's "simple" layout.
+
+    With fixed ``widths`` rows are formatted as they arrive and wider cells
+    simply overflow their column. Without them, ``rows`` may be a callable
+    returning a fresh iterable: it is consumed once to measure the columns
+    and once more to render, so nothing is buffered. A plain iterable is
+    buffered to measure it.
+    """
+    aligns = aligns or ["left"] * len(headers)
+    if widths is None:
+        if callable(rows):
+            widths = measureWidths(headers, rows())
+        else:
+            rows = list(rows)
+            widths = measureWidths(headers, rows)
+    widths = [max(width, len(header)) for width, header in zip(widths, headers)]
+    if callable(rows):
+        rows = rows()
+
+    yield formatLine(headers, widths, aligns)
+    yield formatLine(["-" * width for width in widths], widths, aligns)
+    for row in rows:
+        yield formatLine([formatCell(value) for value in row], widths, aligns)
@@ -88,6 +88,21 @@ class StudySession(BaseModel):
         orm_mode = True
 
 
+class NewStudySession(BaseModel):
+    course: str
+    start_session: datetime
+    end_session: datetime
+
+
+class ReportRow(BaseModel):
+    course: str
+    total_seconds: int
+    session_count: int
+
+    class Config:
+        orm_mode = True
+
+
 class BaseStudySession(BaseModel):
     id: Optional[int]
     subscription_id: Optional[int]
@@ -0,0 +1,76 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import pytest
+
+# Every module reads its settings from the environment on import, so they
+# point at a scratch directory before anything from the application is
+# imported. Each test then gets its own copy of one generated database at
+# the same path, with empty archive and snapshot directories.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH = tempfile.mkdtemp(prefix="study-tests-")
+DATABASE = os.path.join(SCRATCH, "study.db")
+TEMPLATE = os.path.join(SCRATCH, "template.db")
+
+os.environ["STUDY_DATABASE_URL"] = f"sqlite:///{DATABASE}"
+os.environ["STUDY_CONFIG"] = os.path.join(SCRATCH, "study.ini")
+for name in ("STUDY_DB_PROFILE", "STUDY_LOOKUP_CACHE", "STUDY_ARCHIVE_DIR",
+                "STUDY_SNAPSHOT_DIR"):
+    os.environ.pop(name, None)
+
+from benchmark.generate import generate  # noqa: E402
+
+generate(TEMPLATE, users=3, categories=2, courses=4, subscriptions=2,
+            sessions=2000, days=730)
+
+
+def copyDatabase(source: str, target: str):
+    # the backup API copies a consistent database whatever its WAL holds
+    with sqlite3.connect(f"file:{source}?mode=ro", uri=True) as reader, \
+            sqlite3.connect(target) as writer:
+        reader.backup(writer)
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    """A fresh copy of the generated database, returning its path."""
+    from database.cache import lookupCache
+    from database.db import engine
+
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DATABASE + suffix):
+            os.remove(DATABASE + suffix)
+    copyDatabase(TEMPLATE, DATABASE)
+    monkeypatch.setenv("STUDY_ARCHIVE_DIR", str(tmp_path / "archive"))
+    lookupCache.entries.clear()
+    lookupCache.version = None
+    yield DATABASE
+    engine.dispose()
+
+
+@pytest.fixture
+def db():
+    from database.db import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
+@pytest.fixture
+def legacyDatabase(tmp_path):
+    """A copy of the database shipped with the repository, at version 0."""
+    path = str(tmp_path / "legacy.db")
+    copyDatabase(os.path.join(ROOT, "database", "sqlite.db"), path)
+    return path
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH, ignore_errors=True)
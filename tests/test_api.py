@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("aiosqlite")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import api  # noqa: E402
+from database.crud import CrudStudy  # noqa: E402
+from database.db import SessionLocal  # noqa: E402
+from database.models import Courses, Subscriptions  # noqa: E402
+from schema import schema  # noqa: E402
+
+EMAIL = "USER1@EXAMPLE.COM"
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    # every test copies a new database file, so the watcher is opened on it
+    monkeypatch.setattr(api, "watcher", api.ChangeWatcher(database))
+    monkeypatch.setattr(api, "reports", {})
+    with TestClient(api.app) as client:
+        yield client
+
+
+@pytest.fixture
+def course(db):
+    return db.query(Courses.name).join(Subscriptions).\
+        filter(Subscriptions.id==1).scalar()
+
+
+@pytest.mark.parametrize("limit", [0, -1, api.MAX_PAGE + 1])
+def testPageLimitIsBounded(client, course, limit):
+    response = client.get(f"/users/{EMAIL}/sessions",
+                            params={"course": course, "limit": limit})
+    assert response.status_code == 422
+
+
+def testCursorWalksEverySession(client, course, db):
+    expected = [row.id for row in CrudStudy().iterStudySessionRows(db, [1])]
+    ids, params = [], {"course": course, "limit": 40}
+    while True:
+        response = client.get(f"/users/{EMAIL}/sessions", params=params)
+        assert response.status_code == 200
+        ids += [row["id"] for row in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        params["cursor"] = cursor
+    assert len(expected) > 40 and ids == expected
+
+    response = client.get(f"/users/{EMAIL}/sessions",
+                            params={"course": course, "cursor": "yesterday"})
+    assert response.status_code == 422
+
+
+def testReportETagFollowsDataVersion(client, course):
+    first = client.get(f"/users/{EMAIL}/report")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    notModified = client.get(f"/users/{EMAIL}/report",
+                                headers={"If-None-Match": etag})
+    assert notModified.status_code == 304
+    assert client.get(f"/users/{EMAIL}/report").headers["ETag"] == etag
+
+    # a commit from another connection, as another process would make
+    start = datetime(2024, 1, 1, 8)
+    with SessionLocal() as db:
+        CrudStudy().createStudySession(db, schema.BaseStudySession(
+            subscription_id=1, start_session=start,
+            end_session=start + timedelta(hours=1)))
+        db.commit()
+    changed = client.get(f"/users/{EMAIL}/report",
+                            headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    counts = {row["course"]: row["session_count"] for row in first.json()}
+    assert {row["course"]: row["session_count"]
+            for row in changed.json()}[course] == counts[course] + 1
+
+    # and one made through the API itself
+    response = client.post(f"/users/{EMAIL}/sessions", json={
+        "course": course,
+        "start_session": (start + timedelta(days=1)).isoformat(),
+        "end_session": (start + timedelta(days=1, hours=1)).isoformat()})
+    assert response.status_code == 201
+    assert client.get(f"/users/{EMAIL}/report").headers["ETag"] != \
+        changed.headers["ETag"]
@@ -0,0 +1,97 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+from click.testing import CliRunner
+from sqlalchemy import func, select
+
+import app
+from database.crud import CrudStudy
+from database.db import SessionLocal
+from database.models import StudySession, Subscriptions
+from schema import schema
+
+CUTOFF = datetime(2021, 1, 1)
+
+
+def readState(db):
+    # everything a reader sees of the study sessions, wherever they are kept
+    crud = CrudStudy()
+    ids = db.execute(select(Subscriptions.id)).scalars().all()
+    return {
+        "listing": [tuple(row) for row in crud.iterStudySessionRows(db, ids)],
+        "sessions": sorted((row.id, row.start_session, row.duration_seconds)
+                            for row in crud.readStudySessions(db, ids)),
+        "reports": [[tuple(row) for row in crud.readReport(db, userID, by)]
+                    for userID in (1, 2, 3) for by in (None, "hour")],
+        "stream": [tuple(row) for row in crud.streamStudySessions(db, 1)],
+    }
+
+
+def archive(before: datetime = CUTOFF):
+    with SessionLocal() as db:
+        moved = CrudStudy().archiveStudySessions(db, before)
+        db.commit()
+    return moved
+
+
+def countLive(db):
+    return db.execute(select(func.count(StudySession.id))).scalar()
+
+
+def testArchiveRoundTrip(db):
+    before = readState(db)
+    moved = archive()
+    assert [year for year, _ in moved] == [2020]
+    db.expire_all()
+
+    assert db.execute(select(func.count(StudySession.id)).\
+        where(StudySession.start_session < CUTOFF)).scalar() == 0
+    [entry] = CrudStudy().readArchives(db)
+    assert entry.rows == moved[0][1]
+    assert entry.year == 2020 and entry.last_start < CUTOFF
+    assert readState(db) == before
+
+    # the rollup still counts archived sessions after a rebuild
+    CrudStudy().rebuildDailyRollup(db)
+    assert readState(db) == before
+
+
+def testArchiveAgainMovesNothing():
+    archive()
+    assert archive() == []
+
+
+def testArchivedIdsAreNotReused(db):
+    highest = db.execute(select(func.max(StudySession.id))).scalar()
+    archive(datetime(2030, 1, 1))
+    db.expire_all()
+    assert countLive(db) == 0
+
+    start = datetime(2031, 1, 1, 8)
+    CrudStudy().createStudySession(db, schema.BaseStudySession(
+        subscription_id=1, start_session=start,
+        end_session=start + timedelta(hours=1)))
+    assert db.execute(select(func.max(StudySession.id))).scalar() > highest
+
+
+def testReusedIdStopsArchive(db):
+    archive(datetime(2020, 7, 1))
+    db.expire_all()
+    [entry] = CrudStudy().readArchives(db)
+    live = db.execute(select(StudySession).\
+        where(StudySession.start_session < CUTOFF).limit(1)).scalar()
+    count = countLive(db)
+    # an archived row under the id of a different live row
+    with sqlite3.connect(entry.path) as connection:
+        connection.execute(
+            "INSERT INTO studysession (id, subscription_id, start_session, "
+            "end_session, start_epoch, end_epoch, duration_seconds) "
+            "VALUES (?, ?, '2020-01-02 10:00:00.000000', "
+            "'2020-01-02 11:00:00.000000', 0, 3600, 3600)",
+            (live.id, live.subscription_id))
+    db.rollback()
+
+    result = CliRunner().invoke(app.main, ["archive", "--before", "2021-01-01"])
+    assert result.exit_code == 1
+    assert "have the id of a different archived session" in result.output
+    assert countLive(db) == count
@@ -0,0 +1,86 @@
+import json
+import sqlite3
+
+from sqlalchemy import insert
+
+from database.cache import LookupCache, lookupCache
+from database.crud import CrudCourse
+from database.db import SessionLocal
+from database.models import Courses
+from schema import schema
+
+
+def readId(name: str):
+    with SessionLocal() as db:
+        id = CrudCourse().readCourseIdByName(db, name)
+        db.commit()
+    return id
+
+
+def testCommittedLookupsAreCached():
+    id = readId("course1")
+    assert id is not None
+    assert lookupCache.entries[("course", "COURSE1")] == id
+    assert readId("COURSE1") == id
+
+
+def testRolledBackCourseIsNotCached():
+    crud = CrudCourse()
+    with SessionLocal() as db:
+        crud.createCourse(db, schema.BaseCourse(name="phantom",
+                                                category_id=1))
+        assert crud.readCourseIdByName(db, "phantom") is not None
+        db.rollback()
+    assert ("course", "PHANTOM") not in lookupCache.entries
+    assert readId("phantom") is None
+
+
+def testUncommittedRowIsNotCached():
+    # a row seen inside a transaction that is rolled back never reaches the
+    # cache, even when it was written without invalidating it
+    with SessionLocal() as db:
+        db.execute(insert(Courses).values(name="PHANTOM", category_id=1))
+        assert CrudCourse().readCourseIdByName(db, "phantom") is not None
+        db.rollback()
+    assert ("course", "PHANTOM") not in lookupCache.entries
+    assert readId("phantom") is None
+
+
+def testCreateAndDeleteInvalidate():
+    crud = CrudCourse()
+    assert readId("course1") is not None
+    with SessionLocal() as db:
+        crud.createCourse(db, schema.BaseCourse(name="fresh", category_id=1))
+        db.commit()
+    assert lookupCache.entries == {}
+    id = readId("fresh")
+    assert id is not None
+
+    with SessionLocal() as db:
+        crud.deleteCourse(db, crud.readCourseByID(db, id))
+        db.commit()
+    assert readId("fresh") is None
+
+
+def testChangesFromAnotherProcessInvalidate(database):
+    id = readId("course2")
+    assert id is not None
+    # what another process deleting the course commits
+    with sqlite3.connect(database) as connection:
+        connection.execute("DELETE FROM course WHERE id = ?", (id,))
+        connection.execute("UPDATE lookupversion SET version = version + 1")
+    assert readId("course2") is None
+
+
+def testCacheFileIsSharedBetweenRuns(tmp_path, monkeypatch):
+    path = tmp_path / "lookups.json"
+    monkeypatch.setattr(lookupCache, "path", str(path))
+    id = readId("course3")
+    data = json.loads(path.read_text())
+    assert ["course", "COURSE3", id] in data["entries"]
+
+    # a new process with the same file and version starts warm
+    cache = LookupCache(path=str(path))
+    with SessionLocal() as db:
+        cache.validate(db)
+    assert cache.entries[("course", "COURSE3")] == id
@@ -0,0 +1,99 @@
+import json
+from datetime import datetime
+
+import pytest
+from click.testing import CliRunner
+from sqlalchemy import func, select
+
+import app
+from database.models import Courses, StudySession, StudySessionDaily
+from database.models import Subscriptions
+
+GOOD = "2024-01-01T08:00:00", "2024-01-01T09:00:00"
+
+
+@pytest.fixture
+def course(db):
+    # a course the logged in user is subscribed to
+    return db.query(Courses.name).join(Subscriptions).\
+        filter(Subscriptions.id==1).scalar()
+
+
+def writeJsonl(path, rows):
+    path.write_text("".join(row if isinstance(row, str) else
+                            json.dumps(row) + "\n" for row in rows))
+    return str(path)
+
+
+def session(course: str, start: str, end: str):
+    return {"course": course, "start_session": start, "end_session": end}
+
+
+def runImport(path: str):
+    # one row per batch, so earlier rows are already written when a bad one
+    # is met
+    return CliRunner().invoke(app.main, ["import", path, "--batch-size", "1"])
+
+
+def counts(db):
+    db.expire_all()
+    return (db.execute(select(func.count(StudySession.id))).scalar(),
+            db.execute(select(func.sum(StudySessionDaily.count))).scalar())
+
+
+def testImportsCsv(db, course, tmp_path):
+    path = tmp_path / "sessions.csv"
+    path.write_text("course,start_session,end_session\n"
+                    f"{course.lower()},2024-01-01 08:00:00,2024-01-01 09:00:00\n"
+                    f"{course},2024-01-02T08:00:00,2024-01-02T08:30:00\n")
+    sessions, rolledUp = counts(db)
+    result = runImport(str(path))
+    assert result.exit_code == 0, result.output
+    assert "2 study sessions imported" in result.output
+    assert counts(db) == (sessions + 2, rolledUp + 2)
+
+
+def testOffsetTimesAreStoredAsLocal(db, course, tmp_path):
+    start, end = "2024-01-01T10:00:00+02:00", "2024-01-01T11:30:00+02:00"
+    path = writeJsonl(tmp_path / "sessions.jsonl", [session(course, start,
+                                                            end)])
+    result = runImport(path)
+    assert result.exit_code == 0, result.output
+    db.expire_all()
+    row = db.execute(select(StudySession).\
+        order_by(StudySession.id.desc()).limit(1)).scalar()
+    local = datetime.fromisoformat(start).astimezone().replace(tzinfo=None)
+    assert row.start_session == local
+    assert row.start_session.tzinfo is None
+    assert row.duration_seconds == 5400
+
+
+@pytest.mark.parametrize("badRow, message", [
+    ("{not json\n", "line 2"),
+    ("[1, 2]\n", "line 2: expected a JSON object"),
+    ({"end_session": None}, "row 2: missing end_session"),
+    ({"start_session": "yesterday"}, "invalid datetime format"),
+    ({"course": "NOT A COURSE"}, "row 2: not subscribed"),
+])
+def testBadJsonlRowRollsBack(db, course, tmp_path, badRow, message):
+    if isinstance(badRow, dict):
+        badRow = json.dumps({**session(course, *GOOD), **badRow}) + "\n"
+    path = writeJsonl(tmp_path / "sessions.jsonl",
+                        [session(course, *GOOD), badRow,
+                            session(course, *GOOD)])
+    before = counts(db)
+    result = runImport(path)
+    assert result.exit_code == 1
+    assert message in result.output
+    assert counts(db) == before
+
+
+def testCsvMissingColumnRollsBack(db, course, tmp_path):
+    path = tmp_path / "sessions.csv"
+    path.write_text("course,start_session\n"
+                    f"{course},2024-01-01 08:00:00\n")
+    before = counts(db)
+    result = runImport(str(path))
+    assert result.exit_code == 1
+    assert "row 1: missing end_session" in result.output
+    assert counts(db) == before
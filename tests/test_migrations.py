@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+
+from database import migrations
+from database.db import createEngine
+from database.models import StudySession, StudySessionDaily, durationSeconds
+
+
+def readVersion(engine):
+    with engine.connect() as connection:
+        return migrations.readVersion(connection)
+
+
+def testGeneratedDatabaseIsCurrent(database):
+    engine = createEngine(f"sqlite:///{database}")
+    assert migrations.SCHEMA_VERSION == 6
+    assert readVersion(engine) == migrations.SCHEMA_VERSION
+    engine.dispose()
+
+
+def testUpgradesShippedDatabase(legacyDatabase):
+    engine = createEngine(f"sqlite:///{legacyDatabase}")
+    listing = select(StudySession.id, StudySession.start_session,
+                        StudySession.end_session).order_by(StudySession.id)
+    with engine.connect() as connection:
+        before = connection.execute(listing).all()
+    assert readVersion(engine) == 0
+
+    migrations.upgrade(engine)
+    assert readVersion(engine) == migrations.SCHEMA_VERSION
+    with engine.connect() as connection:
+        after = connection.execute(listing).all()
+        rows = connection.execute(select(StudySession).\
+            order_by(StudySession.id)).all()
+        created = connection.execute(text(
+            "SELECT sql FROM sqlite_master WHERE name = 'studysession'")).\
+            scalar()
+        sequence = connection.execute(text(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'studysession'")).\
+            scalar()
+        daily = connection.execute(select(func.sum(StudySessionDaily.seconds),
+                                            func.sum(StudySessionDaily.count))).\
+            one()
+    assert after == before
+    assert all(row.duration_seconds ==
+                durationSeconds(row.start_session, row.end_session)
+                for row in rows)
+    assert "AUTOINCREMENT" in created.upper()
+    assert sequence == max(row.id for row in rows)
+    # the rollup is kept per subscription; the shipped database has sessions
+    # without one
+    subscribed = [row for row in rows if row.subscription_id is not None]
+    assert tuple(daily) == (sum(row.duration_seconds for row in subscribed),
+                            len(subscribed))
+
+    # a second run finds the database current and changes nothing
+    migrations.upgrade(engine)
+    assert readVersion(engine) == migrations.SCHEMA_VERSION
+    engine.dispose()
+
+
+def testDeletedIdsAreNotReused(legacyDatabase):
+    engine = createEngine(f"sqlite:///{legacyDatabase}")
+    migrations.upgrade(engine)
+    start = datetime(2024, 1, 1, 8)
+    with engine.begin() as connection:
+        highest = connection.execute(select(func.max(StudySession.id))).scalar()
+        connection.execute(StudySession.__table__.delete().\
+            where(StudySession.id==highest))
+        id = connection.execute(StudySession.__table__.insert().values(
+            subscription_id=1,
+            **StudySession.columnsFor(start, start + timedelta(hours=1)))).\
+            inserted_primary_key[0]
+    assert id > highest
+    engine.dispose()
@@ -0,0 +1,78 @@
+import re
+from datetime import datetime, timedelta
+
+from click.testing import CliRunner
+
+import app
+from database.crud import CrudStudy
+from database.models import Courses, Subscriptions
+from schema import schema
+
+
+def addTies(db, subscriptionID: int):
+    # sessions starting at the same moment are ordered by id
+    start = datetime(2020, 6, 1, 10)
+    CrudStudy().bulkCreate(db, [schema.BaseStudySession(
+        subscription_id=subscriptionID, start_session=start,
+        end_session=start + timedelta(minutes=30))] * 5)
+    db.commit()
+
+
+def walk(readPage, limit: int):
+    rows, after = [], None
+    while True:
+        page = readPage(limit, after)
+        assert len(page) <= limit
+        if not page:
+            return rows
+        rows.extend(page)
+        after = page[-1].start_session, page[-1].id
+
+
+def testKeysetPagesCoverListing(db):
+    addTies(db, 1)
+    crud = CrudStudy()
+    ids = [1, 2]
+    listing = [(row.start_session, row.id)
+                for row in crud.iterStudySessionRows(db, ids)]
+    assert listing == sorted(listing)
+    assert len(set(listing)) == len(listing)
+
+    rowPages = walk(lambda limit, after: crud.readStudySessionRowsPage(
+        db, ids, limit, after=after), 7)
+    assert [(row.start_session, row.id) for row in rowPages] == listing
+    ormPages = walk(lambda limit, after: crud.readStudySessionsPage(
+        db, ids, limit, after=after, strategy="joined"), 7)
+    assert [(row.start_session, row.id) for row in ormPages] == listing
+
+
+def testKeysetPagesWithinRange(db):
+    crud = CrudStudy()
+    since, until = datetime(2020, 5, 1), datetime(2020, 9, 1)
+    listing = [row.id for row in crud.iterStudySessionRows(db, [1], since,
+                                                            until)]
+    pages = walk(lambda limit, after: crud.readStudySessionRowsPage(
+        db, [1], limit, since, until, after), 4)
+    assert listing and [row.id for row in pages] == listing
+
+
+def testStudyCursorResumesListing(db):
+    addTies(db, 1)
+    course = db.query(Courses.name).join(Subscriptions).\
+        filter(Subscriptions.id==1).scalar()
+    expected = [row.id for row in CrudStudy().iterStudySessionRows(db, [1])]
+    assert len(expected) > 50
+
+    ids, cursor = [], []
+    while True:
+        result = CliRunner().invoke(app.main,
+                                    ["study", "--limit", "50", *cursor],
+                                    input=course + "\n")
+        assert result.exit_code == 0, result.output
+        ids += [int(id) for id in re.findall(r"^\s*(\d+)\s", result.output,
+                                                re.MULTILINE)]
+        match = re.search(r"--cursor (\S+)", result.output)
+        if not match:
+            break
+        cursor = ["--cursor", match.group(1)]
+    assert ids == expected
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from database.crud import CrudStudy
+from database.models import Courses, StudySession, StudySessionDaily
+from database.models import Subscriptions
+from schema import schema
+
+
+def rawTotals(db, userID: int):
+    # course totals summed straight from studysession
+    return db.execute(select(Courses.name,
+                                func.sum(StudySession.duration_seconds),
+                                func.count(StudySession.id)).\
+        join(Subscriptions, StudySession.subscription_id==Subscriptions.id).\
+        join(Courses, Subscriptions.course_id==Courses.id).\
+        where(Subscriptions.user_id==userID).\
+        group_by(Courses.name).order_by(Courses.name)).all()
+
+
+def readDaily(db):
+    return db.execute(select(StudySessionDaily.subscription_id,
+                                StudySessionDaily.day,
+                                StudySessionDaily.seconds,
+                                StudySessionDaily.count).\
+        order_by(StudySessionDaily.subscription_id,
+                    StudySessionDaily.day)).all()
+
+
+def testReportMatchesRawSessions(db):
+    crud = CrudStudy()
+    for userID in (1, 2, 3):
+        report = crud.readReport(db, userID)
+        assert [tuple(row) for row in report] == \
+            [tuple(row) for row in rawTotals(db, userID)]
+
+
+def testRollupAndRawPathsAgree(db):
+    # whole days are read from the rollup, hours from the raw sessions
+    crud = CrudStudy()
+    since, until = datetime(2020, 3, 1), datetime(2021, 3, 1)
+    byDay = crud.readReport(db, 1, "day", since, until)
+    byHour = crud.readReport(db, 1, "hour", since, until)
+    assert byDay and byHour
+
+    def courseTotals(rows):
+        totals = {}
+        for row in rows:
+            seconds, count = totals.get(row.course, (0, 0))
+            totals[row.course] = (seconds + row.total_seconds,
+                                    count + row.session_count)
+        return totals
+
+    assert courseTotals(byDay) == courseTotals(byHour)
+    assert courseTotals(byDay) == {
+        row.course: (row.total_seconds, row.session_count)
+        for row in crud.readReport(db, 1, since=since, until=until)}
+
+
+def testWritesKeepRollupCurrent(db):
+    crud = CrudStudy()
+    start = datetime(2022, 6, 1, 9, 30)
+    payloads = [schema.BaseStudySession(
+                    subscription_id=1,
+                    start_session=start + timedelta(hours=hour),
+                    end_session=start + timedelta(hours=hour, minutes=45))
+                for hour in range(3)]
+    crud.createStudySession(db, payloads[0])
+    crud.bulkCreate(db, payloads[1:])
+    crud.deleteStudySession(db, db.get(StudySession, 1))
+
+    maintained = readDaily(db)
+    crud.rebuildDailyRollup(db)
+    assert maintained == readDaily(db)
@@ -0,0 +1,102 @@
+import csv
+import json
+from datetime import date, datetime
+from itertools import islice
+from pathlib import Path
+
+FORMATS = ["csv", "jsonl", "parquet"]
+
+
+def detectFormat(path: str):
+    suffix = Path(path).suffix.lstrip(".").lower()
+    return suffix if suffix in FORMATS else None
+
+
+def formatValue(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def writeCsv(rows, path: str, columns: list):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([formatValue(value) for value in row])
+            count += 1
+    return count
+
+
+def writeJsonl(rows, path: str, columns: list):
+    count = 0
+    with open(path, "w", encoding="utf-8") as file:
+        for row in rows:
+            file.write(json.dumps(
+                {column: formatValue(value) for column, value in zip(columns, row)},
+                ensure_ascii=False))
+            file.write("\n")
+            count += 1
+    return count
+
+
+def arrowSchema(columns: list, types: list):
+    import pyarrow as pa
+
+    arrowTypes = {
+        int: pa.int64(),
+        float: pa.float64(),
+        str: pa.string(),
+        bool: pa.bool_(),
+        datetime: pa.timestamp("us"),
+        date: pa.date32(),
+    }
+    return pa.schema([(column, arrowTypes[type])
+                        for column, type in zip(columns, types)])
+
+
+def writeParquet(rows, path: str, columns: list, types: list,
+                    rowGroupSize: int = 65536):
+    # The schema comes from the column types rather than from the first
+    # chunk, where an all-NULL column would be typed null, and the file is
+    # written even when there are no rows.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrowSchema(columns, types)
+    rows = iter(rows)
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        while True:
+            chunk = list(islice(rows, rowGroupSize))
+            if not chunk:
+                break
+            table = pa.Table.from_pydict(
+                {column: list(values) for column, values in zip(columns, zip(*chunk))},
+                schema=schema)
+            writer.write_table(table, row_group_size=rowGroupSize)
+            count += len(chunk)
+    return count
+
+
+WRITERS = {
+    "csv": writeCsv,
+    "jsonl": writeJsonl,
+    "parquet": writeParquet,
+}
+
+
+def writeRows(rows, path: str, columns: list, fileFormat: str,
+                types: list = None):
+    """Write ``rows`` to ``path``; Parquet also needs the Python type of
+    every column, as in ``columnTypes``."""
+    if fileFormat == "parquet":
+        if types is None:
+            raise ValueError("Parquet export needs the column types")
+        return writeParquet(rows, path, columns, types)
+    return WRITERS[fileFormat](rows, path, columns)
+
+
+def columnTypes(statement):
+    return [column.type.python_type for column in statement.selected_columns]
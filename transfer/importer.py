@@ -0,0 +1,46 @@
+import csv
+import json
+from datetime import datetime
+from pathlib import Path
+
+FORMATS = ["csv", "jsonl"]
+
+
+def detectFormat(path: str):
+    suffix = Path(path).suffix.lstrip(".").lower()
+    return suffix if suffix in FORMATS else None
+
+
+def readCsv(file):
+    yield from csv.DictReader(file)
+
+
+def readJsonl(file):
+    for number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            raise ValueError(f"line {number}: {error}")
+        if not isinstance(row, dict):
+            raise ValueError(f"line {number}: expected a JSON object")
+        yield row
+
+
+def localTime(value: datetime):
+    # sessions are stored as naive local wall-clock times
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+READERS = {
+    "csv": readCsv,
+    "jsonl": readJsonl,
+}
+
+
+def readRows(path: str, fileFormat: str):
+    with open(path, newline="", encoding="utf-8") as file:
+        yield from READERS[fileFormat](file)
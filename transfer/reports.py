@@ -0,0 +1,110 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from database.crud import CrudStudy
+from database.db import createEngine
+from database.models import Users
+from transfer import exporter
+
+# Study time reports for many users at once. Users are split into chunks
+# handed out to a process pool; every worker process opens its own engine
+# with the readonly-report profile and writes one file per user, users
+# without study time included.
+
+REPORT_PROFILE = "readonly-report"
+# fewer users than this per chunk cost more in pickling and scheduling
+# than they gain in spreading the work
+MIN_CHUNK_SIZE = 16
+
+workerEngine = None
+workerSession = None
+
+
+def initWorker(url: str = None):
+    # the engine is kept for the life of the process, so running reports
+    # in this process again reuses it
+    global workerEngine, workerSession
+    if workerEngine is not None and url in (None, str(workerEngine.url)):
+        return
+    if workerEngine is not None:
+        workerEngine.dispose()
+    workerEngine = createEngine(url, profile=REPORT_PROFILE)
+    workerSession = sessionmaker(bind=workerEngine)
+
+
+def partition(items: list, size: int):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def reportPath(directory: str, email: str, fileFormat: str):
+    name = email.lower().replace(os.sep, "_")
+    return os.path.join(directory, f"{name}.{fileFormat}")
+
+
+def writeUserReports(users: list, directory: str, fileFormat: str,
+                        by: str = None, since: datetime = None,
+                        until: datetime = None):
+    # users are (id, email) pairs; returns the number of files and of report
+    # rows written
+    if workerSession is None:
+        initWorker()
+    columns = ["course", "total_seconds", "session_count"]
+    types = [str, int, int]
+    if by:
+        # buckets are SQLite date and strftime strings
+        columns.insert(0, by)
+        types.insert(0, str)
+    crud = CrudStudy()
+    files = count = 0
+    with workerSession() as db:
+        for userID, email in users:
+            rows = crud.readReport(db, userID, by, since, until)
+            count += exporter.writeRows((tuple(row) for row in rows),
+                                        reportPath(directory, email,
+                                                    fileFormat),
+                                        columns, fileFormat, types)
+            files += 1
+    return files, count
+
+
+def readUsers(db, ids: list = None):
+    statement = select(Users.id, Users.email).order_by(Users.id)
+    if ids is not None:
+        statement = statement.where(Users.id.in_(ids))
+    return [tuple(row) for row in db.execute(statement)]
+
+
+def writeReports(users: list, directory: str, fileFormat: str,
+                    workers: int = None, chunkSize: int = None,
+                    url: str = None, **options):
+    """Write one report per user with ``workers`` processes, one per CPU by
+    default.
+
+    Users are split evenly across the workers unless ``chunkSize`` is given,
+    in chunks of at least MIN_CHUNK_SIZE users. Returns the number of files
+    and of report rows written. With a single worker everything runs in
+    this process.
+    """
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    if chunkSize is None:
+        chunkSize = max(MIN_CHUNK_SIZE, math.ceil(len(users) / workers))
+    chunks = partition(users, chunkSize)
+    if workers == 1 or len(chunks) <= 1:
+        initWorker(url)
+        results = [writeUserReports(chunk, directory, fileFormat, **options)
+                    for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initWorker,
+                                    initargs=(url,)) as pool:
+            futures = [pool.submit(writeUserReports, chunk, directory,
+                                    fileFormat, **options)
+                        for chunk in chunks]
+            results = [future.result() for future in futures]
+    return (sum(files for files, _ in results),
+            sum(rows for _, rows in results))